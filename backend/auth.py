@@ -22,7 +22,7 @@ import asyncio
 
 from config import settings
 from models import UserProfile
-from table_storage import table_storage
+from table_storage import get_table_storage
 
 
 security = HTTPBearer()
@@ -170,7 +170,7 @@ class AzureAuthHandler:
 
         # Wrap blocking I/O in asyncio.to_thread() to avoid blocking the event loop
         user_data = await asyncio.to_thread(
-            table_storage.create_user,
+            get_table_storage().create_user,
             azure_id=azure_id,
             email=email,
             name=name
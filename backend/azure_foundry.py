@@ -19,15 +19,15 @@ import httpx
 from typing import List, Dict, Any, Optional, AsyncGenerator
 from uuid import UUID
 from datetime import datetime
-import json
+import orjson
 import logging
 import asyncio
 
 from config import settings
-# table_storage is the singleton instance of TableStorageClient
-from table_storage import table_storage 
+# get_table_storage() returns the shared TableStorageClient
+from table_storage import get_table_storage
 from models import Agent
-from azure.identity import DefaultAzureCredential
+from credentials import get_default_credential
 
 logger = logging.getLogger(__name__)
 
@@ -70,8 +70,8 @@ class AzureFoundryClient:
                 except Exception as e2:
                     logger.warning(f"Managed Identity credential failed: {e2}")
                     # Fallback to DefaultAzureCredential
-                    self.credential = DefaultAzureCredential()
-                    logger.info("✓ DefaultAzureCredential initialized")
+                    self.credential = get_default_credential()
+                    logger.info("✓ Shared DefaultAzureCredential initialized")
         except Exception as e:
             logger.error(f"Failed to initialize Azure credential: {e}")
             raise
@@ -94,7 +94,7 @@ class AzureFoundryClient:
         """
         # Wrap blocking I/O in asyncio.to_thread()
         agent_entity = await asyncio.to_thread(
-            table_storage.get_agent_by_azure_id,
+            get_table_storage().get_agent_by_azure_id,
             azure_agent_id
         )
         if agent_entity:
@@ -214,7 +214,7 @@ class AzureFoundryClient:
 
             # Wrap blocking I/O in asyncio.to_thread() to avoid blocking the event loop
             agent_entity = await asyncio.to_thread(
-                table_storage.create_or_update_agent,
+                get_table_storage().create_or_update_agent,
                 azure_agent_id=azure_agent_id,
                 name=name,
                 description=description,
@@ -324,7 +324,7 @@ class AzureFoundryClient:
             
             logger.info(f"Calling endpoint: {endpoint}")
             logger.info(f"Request headers being sent: {dict(headers)}")
-            logger.info(f"Request payload: {json.dumps(payload, indent=2)}")
+            logger.info(f"Request payload: {orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode()}")
             
             async with httpx.AsyncClient(
                 headers=headers,
@@ -466,7 +466,7 @@ class AzureFoundryClient:
                                 break
                             
                             try:
-                                data = json.loads(data_str)
+                                data = orjson.loads(data_str)
                                 
                                 # Extract token from choices
                                 if "choices" in data and len(data["choices"]) > 0:
@@ -477,7 +477,7 @@ class AzureFoundryClient:
                                         logger.debug(f"Streamed token: {content}")
                                         yield content
                                         
-                            except json.JSONDecodeError:
+                            except orjson.JSONDecodeError:
                                 logger.warning(f"Failed to parse SSE data: {data_str}")
                                 continue
 
@@ -495,7 +495,7 @@ class AzureFoundryClient:
         """
         # Wrap blocking I/O in asyncio.to_thread()
         agent_entity = await asyncio.to_thread(
-            table_storage.get_agent_by_id,
+            get_table_storage().get_agent_by_id,
             str(agent_id)
         )
         if agent_entity:
@@ -509,7 +509,7 @@ class AzureFoundryClient:
         """
         # Wrap blocking I/O in asyncio.to_thread()
         agent_entity = await asyncio.to_thread(
-            table_storage.get_agent_by_azure_id,
+            get_table_storage().get_agent_by_azure_id,
             str(azure_agent_id)
         )
         if agent_entity:
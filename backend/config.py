@@ -27,6 +27,13 @@ class Settings(BaseSettings):
     - AZURE_STORAGE_CONNECTION_STRING: Connection string for Azure Storage Account
     - AZURE_STORAGE_ACCOUNT_NAME: Storage account name (alternative to connection string)
     - AZURE_STORAGE_ACCOUNT_KEY: Storage account key (alternative to connection string)
+    - AZURE_STORAGE_BOOTSTRAP_TABLES: Create all missing tables at startup (otherwise created on first write)
+    - AZURE_STORAGE_POOL_SIZE: Max pooled HTTP connections to the Table endpoint
+    - MESSAGE_SHARD_COUNT: Partitions per session for messages (1 = unsharded;
+      raise only for sessions hitting the per-partition throughput limit).
+      Enabling it writes a marker row to the messages table; while that row
+      exists, reads and deletes cover every shard even at 1, so lowering the
+      setting later only stops new messages from being sharded
 
     OAuth Identity Passthrough (MCP):
     - MCP_ENABLED: Enable OAuth Identity Passthrough for agent calls
@@ -47,6 +54,9 @@ class Settings(BaseSettings):
     AZURE_STORAGE_CONNECTION_STRING: Optional[str] = None
     AZURE_STORAGE_ACCOUNT_NAME: Optional[str] = None
     AZURE_STORAGE_ACCOUNT_KEY: Optional[str] = None
+    AZURE_STORAGE_BOOTSTRAP_TABLES: bool = False
+    AZURE_STORAGE_POOL_SIZE: int = 50
+    MESSAGE_SHARD_COUNT: int = 1
 
     # OAuth Identity Passthrough (MCP) Settings
     MCP_ENABLED: bool = True
@@ -55,6 +65,7 @@ class Settings(BaseSettings):
     AZURE_AI_SEARCH_ENDPOINT: Optional[str] = None
     AZURE_AI_SEARCH_KEY: Optional[str] = None
     AZURE_AI_SEARCH_INDEX: str = "documents"
+    RAG_MAX_CONCURRENCY: int = 16
     
     # SharePoint RAG Settings
     SHAREPOINT_SITE_URL: Optional[str] = None
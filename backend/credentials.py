@@ -0,0 +1,42 @@
+"""
+Shared Azure credentials
+
+This module owns the process-wide Azure AD credentials used by every
+backend client that authenticates with Entra ID: a sync credential for
+thread-based callers (Azure Foundry fallback) and an async one for
+event-loop callers (Azure AI Search).
+
+Creating a new DefaultAzureCredential per client or per request throws
+away its in-memory token cache and re-walks the credential chain, which
+adds an AAD round trip and can trigger throttling (HTTP 429) under load.
+Reusing one instance lets every caller share the cached tokens.
+"""
+
+from functools import lru_cache
+
+from azure.identity import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+
+
+@lru_cache(maxsize=None)
+def get_default_credential() -> DefaultAzureCredential:
+    """Return the process-wide DefaultAzureCredential, creating it on first use"""
+    return DefaultAzureCredential()
+
+
+@lru_cache(maxsize=None)
+def get_async_default_credential() -> AsyncDefaultAzureCredential:
+    """
+    Return the process-wide async DefaultAzureCredential for event-loop code.
+
+    Token requests are awaited directly instead of blocking a worker thread,
+    and after the first success the credential keeps using the link of the
+    chain that worked rather than re-probing every source.
+    """
+    return AsyncDefaultAzureCredential()
+
+
+async def close_async_credential() -> None:
+    """Close the async credential's transport if it was ever created"""
+    if get_async_default_credential.cache_info().currsize:
+        await get_async_default_credential().close()
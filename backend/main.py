@@ -14,14 +14,15 @@ Key Features:
 - Comprehensive error handling and logging
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from typing import List, Dict, Any
 from uuid import UUID
 from datetime import datetime
+import hashlib
 import logging
-import json
 import asyncio
 
 from config import settings
@@ -40,9 +41,10 @@ from models import (
 )
 from auth import get_current_user, get_mcp_context, auth_handler
 from azure_foundry import foundry_client
-from table_storage import table_storage
-from rbac import filter_agents_for_user, get_user_roles_from_profile
+from table_storage import get_table_storage, set_request_timestamp
+from rbac import filter_agents_for_user, get_user_roles_from_profile, role_names
 from rag_integration import RAGService
+from credentials import close_async_credential
 
 
 # Configure logging
@@ -53,6 +55,14 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# Serializers built once at import time; endpoints that return these
+# shapes dump JSON directly instead of having FastAPI re-validate the
+# already-constructed models against response_model on every request.
+_AGENT_RESPONSE_ADAPTER = TypeAdapter(AgentResponse)
+_SESSION_LIST_ADAPTER = TypeAdapter(List[ChatSession])
+_MESSAGE_ADAPTER = TypeAdapter(ChatMessage)
+
+
 # Initialize FastAPI application
 app = FastAPI(
     title="Azure Chatbot API",
@@ -63,6 +73,21 @@ app = FastAPI(
 )
 
 
+class RequestTimestampMiddleware:
+    """Pure ASGI middleware fixing a single storage timestamp per request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            set_request_timestamp()
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(RequestTimestampMiddleware)
+
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -77,8 +102,8 @@ app.add_middleware(
 async def startup_event():
     """Initialize services on startup"""
     logger.info("Starting Azure Chatbot API...")
-    logger.info(f"CORS Origins: {settings.cors_origins_list}")
-    logger.info(f"MCP Enabled: {settings.MCP_ENABLED}")
+    logger.info("CORS Origins: %s", settings.cors_origins_list)
+    logger.info("MCP Enabled: %s", settings.MCP_ENABLED)
     
     # Initialize RAG service if configured
     global rag_service
@@ -86,7 +111,8 @@ async def startup_event():
         ai_search_endpoint=settings.AZURE_AI_SEARCH_ENDPOINT,
         ai_search_key=settings.AZURE_AI_SEARCH_KEY,
         sharepoint_tenant_id=settings.AZURE_TENANT_ID if settings.SHAREPOINT_ENABLED else None,
-        sharepoint_site_url=settings.SHAREPOINT_SITE_URL
+        sharepoint_site_url=settings.SHAREPOINT_SITE_URL,
+        max_concurrency=settings.RAG_MAX_CONCURRENCY
     )
     
     if settings.AZURE_AI_SEARCH_ENDPOINT:
@@ -94,6 +120,17 @@ async def startup_event():
     if settings.SHAREPOINT_ENABLED:
         logger.info("✓ RAG: SharePoint enabled")
 
+    # Rewrite any legacy Python-literal agent capabilities as JSON; until this
+    # succeeds, reads fall back to parsing them. A single projected query
+    # once migrated
+    try:
+        await asyncio.to_thread(get_table_storage().migrate_agent_capabilities)
+    except Exception as e:
+        logger.error(
+            "Agent capabilities migration failed; legacy capabilities are parsed "
+            "with a fallback until it succeeds: %s", e
+        )
+
 
 # Global RAG service instance
 rag_service: RAGService = None
@@ -104,6 +141,9 @@ async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down Azure Chatbot API...")
     await foundry_client.close()
+    if rag_service:
+        await rag_service.aclose()
+    await close_async_credential()
 
 
 @app.get("/")
@@ -167,6 +207,24 @@ async def get_mcp_config():
     }
 
 
+@app.get("/api/diagnostics")
+async def get_diagnostics():
+    """
+    Combined health and MCP configuration check.
+
+    Returns both payloads in one response so verification scripts need a
+    single round trip.
+
+    Returns:
+        Dict with mcp_enabled, health and mcp_config
+    """
+    return {
+        "mcp_enabled": settings.MCP_ENABLED,
+        "health": await health_check(),
+        "mcp_config": await get_mcp_config()
+    }
+
+
 @app.get("/api/user-context")
 async def get_user_context(current_user: UserProfile = Depends(get_current_user)):
     """
@@ -179,7 +237,7 @@ async def get_user_context(current_user: UserProfile = Depends(get_current_user)
     Returns:
         Dict with user identity information
     """
-    logger.info(f"User context requested for: {current_user.email}")
+    logger.info("User context requested for: %s", current_user.email)
     return {
         "success": True,
         "user": {
@@ -204,7 +262,7 @@ async def get_user_roles(current_user: UserProfile = Depends(get_current_user)):
     Returns:
         Dict with user roles and permissions
     """
-    logger.info(f"User roles requested for: {current_user.email}")
+    logger.info("User roles requested for: %s", current_user.email)
     
     user_profile = {
         "email": current_user.email,
@@ -212,7 +270,7 @@ async def get_user_roles(current_user: UserProfile = Depends(get_current_user)):
     }
     
     roles = get_user_roles_from_profile(user_profile)
-    roles_list = [role.value for role in roles]
+    roles_list = role_names(roles)
     
     return {
         "success": True,
@@ -245,7 +303,7 @@ async def get_current_user_profile(
     Returns:
         UserProfile: Current user's profile information
     """
-    logger.info(f"User profile requested for: {current_user.email}")
+    logger.info("User profile requested for: %s", current_user.email)
     return current_user
 
 
@@ -268,7 +326,7 @@ async def list_agents(
         AgentResponse: List of agents accessible to the user
     """
     try:
-        logger.info(f"Fetching agents for user: {current_user.email}")
+        logger.info("Fetching agents for user: %s", current_user.email)
         
         # Get all agents from Azure Foundry
         all_agents = await foundry_client.list_agents()
@@ -288,15 +346,19 @@ async def list_agents(
         filtered_agents = [AgentModel(**agent_dict) if isinstance(agent_dict, dict) else agent_dict 
                           for agent_dict in filtered_agents_dicts]
         
-        logger.info(f"Filtered {len(all_agents)} agents to {len(filtered_agents)} for user {current_user.email}")
+        logger.info("Filtered %s agents to %s for user %s", len(all_agents), len(filtered_agents), current_user.email)
 
-        return AgentResponse(
+        agent_response = AgentResponse(
             agents=filtered_agents,
             count=len(filtered_agents)
         )
+        return Response(
+            content=_AGENT_RESPONSE_ADAPTER.dump_json(agent_response),
+            media_type="application/json"
+        )
 
     except Exception as e:
-        logger.error(f"Error fetching agents: {str(e)}")
+        logger.error("Error fetching agents: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch agents: {str(e)}"
@@ -353,7 +415,7 @@ async def create_chat_session(
         SessionResponse: Created session information
     """
     try:
-        logger.info(f"Creating session for user {current_user.email} with agent {request.agent_id}")
+        logger.info("Creating session for user %s with agent %s", current_user.email, request.agent_id)
 
         # Verify agent exists
         agent = await foundry_client.get_agent_by_id(request.agent_id)
@@ -365,7 +427,7 @@ async def create_chat_session(
 
         # Create session - wrap blocking I/O in asyncio.to_thread()
         session_entity = await asyncio.to_thread(
-            table_storage.create_session,
+            get_table_storage().create_session,
             user_azure_id=current_user.azure_id,
             agent_id=str(request.agent_id),
             title=request.title or "New Chat"
@@ -380,14 +442,14 @@ async def create_chat_session(
             updated_at=session_entity["updated_at"],
             is_active=session_entity["is_active"]
         )
-        logger.info(f"Created session: {session.id}")
+        logger.info("Created session: %s", session.id)
 
         return SessionResponse(session=session)
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error creating session: {str(e)}")
+        logger.error("Error creating session: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create session: {str(e)}"
@@ -410,7 +472,7 @@ async def list_user_sessions(
     try:
         # Wrap blocking I/O in asyncio.to_thread()
         session_entities = await asyncio.to_thread(
-            table_storage.get_user_sessions,
+            get_table_storage().get_user_sessions,
             current_user.azure_id
         )
 
@@ -427,10 +489,13 @@ async def list_user_sessions(
             )
             sessions.append(session)
 
-        return sessions
+        return Response(
+            content=_SESSION_LIST_ADAPTER.dump_json(sessions),
+            media_type="application/json"
+        )
 
     except Exception as e:
-        logger.error(f"Error fetching sessions: {str(e)}")
+        logger.error("Error fetching sessions: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch sessions: {str(e)}"
@@ -455,9 +520,11 @@ async def get_session_history(
         ChatHistoryResponse: Session and message history
     """
     try:
-        # Get session - wrap blocking I/O in asyncio.to_thread()
-        session_entity = await asyncio.to_thread(
-            table_storage.get_session_by_id,
+        # Fetch the session and its messages in one partition query - wrap
+        # blocking I/O in asyncio.to_thread(). Returns no session unless it
+        # belongs to this user.
+        session_entity, message_entities = await asyncio.to_thread(
+            get_table_storage().load_session_with_messages,
             user_azure_id=current_user.azure_id,
             session_id=str(session_id)
         )
@@ -478,12 +545,6 @@ async def get_session_history(
             is_active=session_entity["is_active"]
         )
 
-        # Get messages - wrap blocking I/O in asyncio.to_thread()
-        message_entities = await asyncio.to_thread(
-            table_storage.get_session_messages,
-            str(session_id)
-        )
-
         messages = []
         for entity in message_entities:
             message = ChatMessage(
@@ -491,7 +552,7 @@ async def get_session_history(
                 session_id=entity["session_id"],
                 role=entity["role"],
                 content=entity["content"],
-                metadata=json.loads(entity.get("metadata", "{}")),
+                metadata=entity.get("metadata") or {},
                 created_at=entity["created_at"]
             )
             messages.append(message)
@@ -504,13 +565,71 @@ async def get_session_history(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching session history: {str(e)}")
+        logger.error("Error fetching session history: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch session history: {str(e)}"
         )
 
 
+@app.get("/api/sessions/{session_id}/messages")
+async def stream_session_messages(
+    session_id: UUID,
+    current_user: UserProfile = Depends(get_current_user)
+):
+    """
+    Stream a session's messages as newline-delimited JSON.
+
+    Each line is one ChatMessage, in creation order. Messages are read and
+    serialized one at a time, so long sessions are never held as a full list
+    of models.
+
+    Args:
+        session_id: UUID of the chat session
+
+    Headers:
+        Authorization: Bearer <azure_ad_access_token>
+
+    Returns:
+        StreamingResponse (application/x-ndjson): One message per line
+    """
+    try:
+        # Verify session exists and belongs to user - wrap blocking I/O in asyncio.to_thread()
+        session_entity = await asyncio.to_thread(
+            get_table_storage().get_session_by_id,
+            user_azure_id=current_user.azure_id,
+            session_id=str(session_id)
+        )
+    except Exception as e:
+        logger.error("Error fetching session: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch session messages: {str(e)}"
+        )
+
+    if not session_entity:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Session not found"
+        )
+
+    def message_lines():
+        # A sync generator: StreamingResponse iterates it in the threadpool,
+        # so the blocking Table Storage paging stays off the event loop
+        for entity in get_table_storage().iter_session_messages(str(session_id)):
+            message = ChatMessage(
+                id=entity["id"],
+                session_id=entity["session_id"],
+                role=entity["role"],
+                content=entity["content"],
+                metadata=entity.get("metadata") or {},
+                created_at=entity["created_at"]
+            )
+            yield _MESSAGE_ADAPTER.dump_json(message) + b"\n"
+
+    return StreamingResponse(message_lines(), media_type="application/x-ndjson")
+
+
 # Chat Message Endpoints
 @app.post("/api/chat", response_model=MessageResponse)
 async def send_chat_message(
@@ -543,22 +662,22 @@ async def send_chat_message(
         MessageResponse: Agent's response message
     """
     try:
-        logger.info(f"Processing message for session {request.session_id}")
+        logger.info("Processing message for session %s", request.session_id)
         
         # Log MCP context at entry point
         logger.info("═══ MCP CONTEXT AT ENDPOINT ═══")
-        logger.info(f"MCP Context Available: {mcp_context is not None}")
+        logger.info("MCP Context Available: %s", mcp_context is not None)
         if mcp_context:
-            logger.info(f"MCP Enabled: {mcp_context.get('mcp_enabled')}")
+            logger.info("MCP Enabled: %s", mcp_context.get('mcp_enabled'))
             user_id = mcp_context.get('user_identity', {}).get('azure_id', 'unknown')
             user_email = mcp_context.get('user_identity', {}).get('email', 'unknown')
-            logger.info(f"User Identity - Email: {user_email}, ID: {user_id}")
-            logger.info(f"Current User - Email: {current_user.email}, ID: {current_user.id}")
+            logger.info("User Identity - Email: %s, ID: %s", user_email, user_id)
+            logger.info("Current User - Email: %s, ID: %s", current_user.email, current_user.id)
         logger.info("══════════════════════════════")
 
         # Verify session exists and belongs to user - wrap blocking I/O in asyncio.to_thread()
         session_entity = await asyncio.to_thread(
-            table_storage.get_session_by_id,
+            get_table_storage().get_session_by_id,
             user_azure_id=current_user.azure_id,
             session_id=str(request.session_id)
         )
@@ -581,7 +700,7 @@ async def send_chat_message(
 
         # Store user message - wrap blocking I/O in asyncio.to_thread()
         user_message_entity = await asyncio.to_thread(
-            table_storage.create_message,
+            get_table_storage().create_message,
             session_id=str(request.session_id),
             role="user",
             content=request.content,
@@ -593,15 +712,19 @@ async def send_chat_message(
             session_id=user_message_entity["session_id"],
             role=user_message_entity["role"],
             content=user_message_entity["content"],
-            metadata=json.loads(user_message_entity.get("metadata", "{}")),
+            metadata=request.metadata or {},
             created_at=user_message_entity["created_at"]
         )
 
-        # Get conversation history - wrap blocking I/O in asyncio.to_thread()
-        message_entities = await asyncio.to_thread(
-            table_storage.get_session_messages,
-            str(request.session_id),
-            limit=20
+        # Get conversation history and agent info concurrently - wrap
+        # blocking I/O in asyncio.to_thread()
+        message_entities, agent = await asyncio.gather(
+            asyncio.to_thread(
+                get_table_storage().get_session_messages,
+                str(request.session_id),
+                limit=20
+            ),
+            foundry_client.get_agent_by_id(session.agent_id)
         )
 
         conversation_history = [
@@ -609,8 +732,6 @@ async def send_chat_message(
             for msg in message_entities
         ]
 
-        # Get agent info
-        agent = await foundry_client.get_agent_by_id(session.agent_id)
         if not agent:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -618,10 +739,10 @@ async def send_chat_message(
             )
 
         # Send message to agent with MCP context
-        logger.info(f"Calling agent {agent.azure_agent_id} with MCP context")
-        logger.info(f"MCP Context being passed: {bool(mcp_context)}")
+        logger.info("Calling agent %s with MCP context", agent.azure_agent_id)
+        logger.info("MCP Context being passed: %s", bool(mcp_context))
         if mcp_context:
-            logger.info(f"  └─ MCP will include user: {mcp_context.get('user_identity', {}).get('email')}")
+            logger.info("  └─ MCP will include user: %s", mcp_context.get('user_identity', {}).get('email'))
         agent_response = await foundry_client.send_message(
             agent_id=agent.azure_agent_id,
             message=request.content,
@@ -630,13 +751,21 @@ async def send_chat_message(
             stream=False
         )
 
-        # Store agent response - wrap blocking I/O in asyncio.to_thread()
-        assistant_message_entity = await asyncio.to_thread(
-            table_storage.create_message,
-            session_id=str(request.session_id),
-            role="assistant",
-            content=agent_response.get("content", ""),
-            metadata=agent_response.get("metadata", {})
+        # Store agent response and bump the session timestamp concurrently -
+        # wrap blocking I/O in asyncio.to_thread()
+        assistant_message_entity, _ = await asyncio.gather(
+            asyncio.to_thread(
+                get_table_storage().create_message,
+                session_id=str(request.session_id),
+                role="assistant",
+                content=agent_response.get("content", ""),
+                metadata=agent_response.get("metadata", {})
+            ),
+            asyncio.to_thread(
+                get_table_storage().update_session_timestamp,
+                user_azure_id=current_user.azure_id,
+                session_id=str(request.session_id)
+            )
         )
 
         assistant_message = ChatMessage(
@@ -644,25 +773,18 @@ async def send_chat_message(
             session_id=assistant_message_entity["session_id"],
             role=assistant_message_entity["role"],
             content=assistant_message_entity["content"],
-            metadata=json.loads(assistant_message_entity.get("metadata", "{}")),
+            metadata=agent_response.get("metadata", {}),
             created_at=assistant_message_entity["created_at"]
         )
 
-        # Update session timestamp - wrap blocking I/O in asyncio.to_thread()
-        await asyncio.to_thread(
-            table_storage.update_session_timestamp,
-            user_azure_id=current_user.azure_id,
-            session_id=str(request.session_id)
-        )
-
-        logger.info(f"Message processed successfully for session {request.session_id}")
+        logger.info("Message processed successfully for session %s", request.session_id)
 
         return MessageResponse(message=assistant_message)
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
+        logger.error("Error processing message: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process message: {str(e)}"
@@ -690,11 +812,11 @@ async def send_chat_message_stream(
         StreamingResponse (text/event-stream): Stream of response content
     """
     try:
-        logger.info(f"Streaming message request for session {request.session_id}")
+        logger.info("Streaming message request for session %s", request.session_id)
 
         # 1. Verify session (same logic as send_chat_message)
         session_entity = await asyncio.to_thread(
-            table_storage.get_session_by_id,
+            get_table_storage().get_session_by_id,
             user_azure_id=current_user.azure_id,
             session_id=str(request.session_id)
         )
@@ -711,7 +833,7 @@ async def send_chat_message_stream(
 
         # 3. Get conversation history (same logic)
         message_entities = await asyncio.to_thread(
-            table_storage.get_session_messages,
+            get_table_storage().get_session_messages,
             str(request.session_id),
             limit=20
         )
@@ -747,12 +869,12 @@ async def send_chat_message_stream(
                 yield chunk
 
             # --- Post-Stream Storage (Crucial Step for History) ---
-            logger.info(f"Stream complete. Storing response for session {request.session_id}")
+            logger.info("Stream complete. Storing response for session %s", request.session_id)
             
             # Store the final agent response
             if full_response_content:
                 await asyncio.to_thread(
-                    table_storage.create_message,
+                    get_table_storage().create_message,
                     session_id=str(request.session_id),
                     role="assistant",
                     content=full_response_content,
@@ -761,7 +883,7 @@ async def send_chat_message_stream(
             
             # Update session timestamp
             await asyncio.to_thread(
-                table_storage.update_session_timestamp,
+                get_table_storage().update_session_timestamp,
                 user_azure_id=current_user.azure_id,
                 session_id=str(request.session_id)
             )
@@ -779,7 +901,7 @@ async def send_chat_message_stream(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error streaming message: {str(e)}")
+        logger.error("Error streaming message: %s", e)
         # If the streaming fails before the response starts, raise an HTTP error.
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -806,7 +928,7 @@ async def delete_session(
     try:
         # Verify session exists and belongs to user - wrap blocking I/O in asyncio.to_thread()
         session_entity = await asyncio.to_thread(
-            table_storage.get_session_by_id,
+            get_table_storage().get_session_by_id,
             user_azure_id=current_user.azure_id,
             session_id=str(session_id)
         )
@@ -819,19 +941,19 @@ async def delete_session(
 
         # Delete session and all its messages - wrap blocking I/O in asyncio.to_thread()
         await asyncio.to_thread(
-            table_storage.delete_session,
+            get_table_storage().delete_session,
             user_azure_id=current_user.azure_id,
             session_id=str(session_id)
         )
 
-        logger.info(f"Deleted session: {session_id}")
+        logger.info("Deleted session: %s", session_id)
 
         return {"success": True, "message": "Session deleted"}
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error deleting session: {str(e)}")
+        logger.error("Error deleting session: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete session: {str(e)}"
@@ -871,7 +993,7 @@ async def search_knowledge_base(
                 detail="RAG service not configured. Please set AZURE_AI_SEARCH_ENDPOINT or enable SharePoint."
             )
         
-        logger.info(f"RAG search for user {current_user.email}: {query}")
+        logger.info("RAG search for user %s: %s", current_user.email, query)
         
         # Get user's OAuth token for SharePoint access
         user_token = mcp_context.get("oauth_token")
@@ -889,7 +1011,7 @@ async def search_knowledge_base(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"RAG search error: {str(e)}")
+        logger.error("RAG search error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Knowledge base search failed: {str(e)}"
@@ -922,9 +1044,11 @@ async def get_rag_config():
     }
 
 
-@app.post("/api/rag/consent")
+@app.api_route("/api/rag/consent", methods=["GET", "POST"])
 async def request_rag_consent(
     source: str,
+    request: Request,
+    response: Response,
     current_user: UserProfile = Depends(get_current_user)
 ):
     """
@@ -933,6 +1057,10 @@ async def request_rag_consent(
     This endpoint returns the OAuth consent URL for accessing
     specific RAG sources like SharePoint that require additional permissions.
     
+    The consent URL is deterministic per source, so the response carries
+    an ETag and a private Cache-Control header. Clients that send a
+    matching If-None-Match header receive 304 Not Modified with no body.
+    
     Args:
         source: RAG source (sharepoint, onedrive, etc.)
     
@@ -977,6 +1105,14 @@ async def request_rag_consent(
         f"&state={source}"
     )
     
+    etag = f'"{hashlib.blake2b(consent_url.encode(), digest_size=8).hexdigest()}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    
+    response.headers.update(cache_headers)
+    
     return {
         "source": source,
         "resource": config["resource"],
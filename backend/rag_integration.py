@@ -11,16 +11,202 @@ Features:
 - Knowledge base querying with user permissions
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
+from collections import OrderedDict
+from functools import lru_cache
+import asyncio
+import copy
+import hashlib
 import logging
+import time
 import httpx
+import orjson
 from datetime import datetime
-from azure.identity import DefaultAzureCredential
 from azure.core.credentials import AzureKeyCredential
 
+from credentials import get_async_default_credential
+
 logger = logging.getLogger(__name__)
 
 
+def _create_http_client(max_connections: int = 50) -> httpx.AsyncClient:
+    """Create a pooled HTTP client for outbound RAG requests"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(20, max_connections)
+        ),
+        timeout=30.0
+    )
+
+
+class _ConcurrencyLimiter:
+    """
+    Async context manager capping in-flight requests to one upstream host.
+    
+    Keeps bursts of concurrent users from exhausting the connection pool
+    and tripping upstream throttling; excess callers wait their turn.
+    """
+    
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self._semaphore = asyncio.Semaphore(limit)
+    
+    async def __aenter__(self) -> "_ConcurrencyLimiter":
+        await self._semaphore.acquire()
+        self.active += 1
+        if self.active == self.limit:
+            logger.debug("%s concurrency limit reached (%s in flight)", self.name, self.limit)
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        self.active -= 1
+        self._semaphore.release()
+
+
+_PERMISSION_FILTER_TEMPLATE = "permissions/any(p: p eq '{user}' or p eq 'everyone')"
+
+
+def _escape_odata(value: str) -> str:
+    """Escape a value for use inside an OData string literal"""
+    return value.replace("'", "''")
+
+
+@lru_cache(maxsize=1024)
+def _permission_filter(user_email: str) -> str:
+    """Build (once per user) the filter limiting results to documents the user may see"""
+    return _PERMISSION_FILTER_TEMPLATE.format(user=_escape_odata(user_email))
+
+
+def _document_key(doc: Dict[str, Any]) -> Optional[str]:
+    """
+    Identify a search result by URL, falling back to a content hash.
+
+    Returns None for a result with neither, which is never treated as a
+    duplicate: all empty documents would otherwise share one key.
+    """
+    url = doc.get("url")
+    if url:
+        return url
+    content = (doc.get("content") or "")[:4096]
+    if not content:
+        return None
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+class _TokenCache:
+    """
+    Async cache for an Azure AD access token.
+    
+    The cached token is returned while it is fresh. Inside the refresh
+    window before expiry the cached token is still returned, but a single
+    background refresh is started. Callers only wait on the token endpoint
+    when no token is cached or the cached one has expired.
+    """
+    
+    REFRESH_WINDOW_SECONDS = 180
+    
+    def __init__(self, credential, scope: str):
+        self._credential = credential
+        self._scope = scope
+        self._token: Optional[str] = None
+        self._expires_on: float = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+    
+    async def get(self) -> str:
+        """Return a valid access token, refreshing it when needed"""
+        now = time.time()
+        if self._token and now < self._expires_on - self.REFRESH_WINDOW_SECONDS:
+            return self._token
+        
+        if self._token and now < self._expires_on:
+            # Stale but still valid: serve it and refresh in the background
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._background_refresh())
+            return self._token
+        
+        return await self._refresh()
+    
+    async def _refresh(self) -> str:
+        async with self._lock:
+            # Another caller may have refreshed while we waited for the lock
+            if self._token and time.time() < self._expires_on - self.REFRESH_WINDOW_SECONDS:
+                return self._token
+            
+            access_token = await self._credential.get_token(self._scope)
+            self._token = access_token.token
+            self._expires_on = access_token.expires_on
+            return self._token
+    
+    async def _background_refresh(self) -> None:
+        try:
+            await self._refresh()
+        except Exception as e:
+            logger.warning("Background token refresh for %s failed: %s", self._scope, e)
+
+
+class _TTLCache:
+    """
+    Small in-process LRU cache whose entries expire after a fixed TTL.
+    
+    Keys are hashed with blake2b so arbitrarily long queries and filters
+    cost a fixed 16 bytes per entry.
+    """
+    
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, tuple[float, Any]]" = OrderedDict()
+    
+    @staticmethod
+    def make_key(*parts: Any) -> bytes:
+        """Build a compact cache key from the given parts"""
+        raw = "\x1f".join("" if p is None else str(p) for p in parts)
+        return hashlib.blake2b(raw.encode(), digest_size=16).digest()
+    
+    def get(self, key: bytes) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: bytes, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class _ApiKeyAuth:
+    """Request headers for API-key authentication (constant per client)"""
+    
+    def __init__(self, api_key: str, base_headers: Dict[str, str]):
+        self._headers = {**base_headers, "api-key": api_key}
+    
+    async def headers(self) -> Dict[str, str]:
+        return self._headers
+
+
+class _AadAuth:
+    """Request headers for Azure AD authentication via a cached bearer token"""
+    
+    def __init__(self, token_cache: _TokenCache, base_headers: Dict[str, str]):
+        self._token_cache = token_cache
+        self._base_headers = base_headers
+    
+    async def headers(self) -> Dict[str, str]:
+        token = await self._token_cache.get()
+        return {**self._base_headers, "Authorization": f"Bearer {token}"}
+
+
 class AzureAISearchClient:
     """
     Client for Azure AI Search RAG integration.
@@ -33,7 +219,11 @@ class AzureAISearchClient:
         self,
         endpoint: str,
         api_key: Optional[str] = None,
-        index_name: str = "documents"
+        index_name: str = "documents",
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache_ttl_seconds: float = 60.0,
+        cache_max_size: int = 256,
+        max_concurrency: int = 16
     ):
         """
         Initialize Azure AI Search client.
@@ -42,20 +232,49 @@ class AzureAISearchClient:
             endpoint: Azure AI Search service endpoint
             api_key: API key for authentication (or use DefaultAzureCredential)
             index_name: Name of the search index
+            http_client: Shared HTTP client (a private one is created if omitted)
+            cache_ttl_seconds: How long identical search responses are reused
+            cache_max_size: Maximum number of cached search responses
+            max_concurrency: Maximum number of concurrent search requests
         """
         self.endpoint = endpoint.rstrip('/')
         self.index_name = index_name
+        self._owns_client = http_client is None
+        self._client = http_client or _create_http_client()
+        self._response_cache = _TTLCache(cache_ttl_seconds, cache_max_size)
+        self._limiter = _ConcurrencyLimiter("Azure AI Search", max_concurrency)
         
-        # Use API key if provided, otherwise use DefaultAzureCredential
+        # Use API key if provided, otherwise use DefaultAzureCredential.
+        # The auth strategy is picked once so requests never branch on it.
+        base_headers = {"Content-Type": "application/json"}
+        self._auth: Union[_ApiKeyAuth, _AadAuth]
         if api_key:
             self.credential = AzureKeyCredential(api_key)
+            self._auth = _ApiKeyAuth(api_key, base_headers)
             logger.info("Azure AI Search client initialized with API key")
         else:
-            self.credential = DefaultAzureCredential()
-            logger.info("Azure AI Search client initialized with DefaultAzureCredential")
+            self.credential = get_async_default_credential()
+            token_cache = _TokenCache(self.credential, "https://search.azure.com/.default")
+            self._auth = _AadAuth(token_cache, base_headers)
+            logger.info("Azure AI Search client initialized with shared async DefaultAzureCredential")
+        
+        # Request fields that never change between searches
+        self._base_search_body = {
+            "select": "id,content,title,url,metadata",
+            "queryType": "semantic",
+            "semanticConfiguration": "default",
+            "captions": "extractive",
+            "answers": "extractive|count-3"
+        }
         
         self.search_url = f"{self.endpoint}/indexes/{self.index_name}/docs/search"
-        logger.info(f"Azure AI Search URL: {self.search_url}")
+        self._search_request_url = f"{self.search_url}?api-version=2023-11-01"
+        logger.info("Azure AI Search URL: %s", self.search_url)
+    
+    async def aclose(self) -> None:
+        """Close the HTTP client if this instance created it"""
+        if self._owns_client:
+            await self._client.aclose()
     
     async def search(
         self,
@@ -77,50 +296,43 @@ class AzureAISearchClient:
             List of search results with relevance scores
         """
         try:
-            search_request = {
-                "search": query,
-                "top": top,
-                "select": "id,content,title,url,metadata",
-                "queryType": "semantic",
-                "semanticConfiguration": "default",
-                "captions": "extractive",
-                "answers": "extractive|count-3"
-            }
+            search_request = {**self._base_search_body, "search": query, "top": top}
             
             # Add user-based filtering if provided
             if user_email and filters:
                 search_request["filter"] = filters
             elif user_email:
                 # Default filter: only show documents accessible to user
-                search_request["filter"] = f"permissions/any(p: p eq '{user_email}' or p eq 'everyone')"
-            
-            headers = {
-                "Content-Type": "application/json",
-                "api-key": self.credential.key if isinstance(self.credential, AzureKeyCredential) else ""
-            }
+                search_request["filter"] = _permission_filter(user_email)
             
-            # If using DefaultAzureCredential, get token
-            if not isinstance(self.credential, AzureKeyCredential):
-                token = await self.credential.get_token("https://search.azure.com/.default")
-                headers["Authorization"] = f"Bearer {token.token}"
+            # Identical searches within the TTL reuse the previous response.
+            # The effective filter is part of the key, so results never leak
+            # across users with different permission scopes.
+            cache_key = _TTLCache.make_key(query, top, user_email, search_request.get("filter"))
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Azure AI Search cache hit for query: %s", query)
+                return list(cached)
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.search_url}?api-version=2023-11-01",
-                    json=search_request,
+            headers = await self._auth.headers()
+            async with self._limiter:
+                response = await self._client.post(
+                    self._search_request_url,
+                    content=orjson.dumps(search_request),
                     headers=headers,
                     timeout=30.0
                 )
-                response.raise_for_status()
-                
-                result = response.json()
-                documents = result.get("value", [])
-                
-                logger.info(f"Azure AI Search returned {len(documents)} results for query: {query}")
-                return documents
+            response.raise_for_status()
+            
+            result = orjson.loads(response.content)
+            documents = result.get("value", [])
+            self._response_cache.set(cache_key, list(documents))
+            
+            logger.info("Azure AI Search returned %s results for query: %s", len(documents), query)
+            return documents
         
         except Exception as e:
-            logger.error(f"Azure AI Search error: {str(e)}")
+            logger.error("Azure AI Search error: %s", e)
             raise
     
     async def get_document(
@@ -139,39 +351,29 @@ class AzureAISearchClient:
             Document data or None if not found/accessible
         """
         try:
-            headers = {
-                "Content-Type": "application/json",
-                "api-key": self.credential.key if isinstance(self.credential, AzureKeyCredential) else ""
-            }
+            response = await self._client.get(
+                f"{self.endpoint}/indexes/{self.index_name}/docs('{document_id}')?api-version=2023-11-01",
+                headers=await self._auth.headers(),
+                timeout=30.0
+            )
             
-            if not isinstance(self.credential, AzureKeyCredential):
-                token = await self.credential.get_token("https://search.azure.com/.default")
-                headers["Authorization"] = f"Bearer {token.token}"
+            if response.status_code == 404:
+                return None
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.endpoint}/indexes/{self.index_name}/docs('{document_id}')?api-version=2023-11-01",
-                    headers=headers,
-                    timeout=30.0
-                )
-                
-                if response.status_code == 404:
+            response.raise_for_status()
+            document = orjson.loads(response.content)
+            
+            # Check user permissions
+            if user_email:
+                permissions = document.get("permissions", [])
+                if user_email not in permissions and "everyone" not in permissions:
+                    logger.warning("User %s denied access to document %s", user_email, document_id)
                     return None
-                
-                response.raise_for_status()
-                document = response.json()
-                
-                # Check user permissions
-                if user_email:
-                    permissions = document.get("permissions", [])
-                    if user_email not in permissions and "everyone" not in permissions:
-                        logger.warning(f"User {user_email} denied access to document {document_id}")
-                        return None
-                
-                return document
+            
+            return document
         
         except Exception as e:
-            logger.error(f"Error retrieving document {document_id}: {str(e)}")
+            logger.error("Error retrieving document %s: %s", document_id, e)
             return None
 
 
@@ -183,18 +385,34 @@ class SharePointMCPConnector:
     using the user's OAuth token (identity passthrough).
     """
     
-    def __init__(self, tenant_id: str, site_url: str):
+    def __init__(
+        self,
+        tenant_id: str,
+        site_url: str,
+        http_client: Optional[httpx.AsyncClient] = None,
+        max_concurrency: int = 16
+    ):
         """
         Initialize SharePoint MCP connector.
         
         Args:
             tenant_id: Azure AD tenant ID
             site_url: SharePoint site URL
+            http_client: Shared HTTP client (a private one is created if omitted)
+            max_concurrency: Maximum number of concurrent Graph search requests
         """
         self.tenant_id = tenant_id
         self.site_url = site_url
         self.graph_api_base = "https://graph.microsoft.com/v1.0"
-        logger.info(f"SharePoint MCP connector initialized for site: {site_url}")
+        self._owns_client = http_client is None
+        self._client = http_client or _create_http_client()
+        self._limiter = _ConcurrencyLimiter("Microsoft Graph", max_concurrency)
+        logger.info("SharePoint MCP connector initialized for site: %s", site_url)
+    
+    async def aclose(self) -> None:
+        """Close the HTTP client if this instance created it"""
+        if self._owns_client:
+            await self._client.aclose()
     
     async def search_sharepoint(
         self,
@@ -232,80 +450,91 @@ class SharePointMCPConnector:
                 ]
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
+            async with self._limiter:
+                response = await self._client.post(
                     f"{self.graph_api_base}/search/query",
-                    json=search_request,
+                    content=orjson.dumps(search_request),
                     headers=headers,
                     timeout=30.0
                 )
-                response.raise_for_status()
-                
-                result = response.json()
-                hits = result.get("value", [{}])[0].get("hitsContainers", [{}])[0].get("hits", [])
-                
-                documents = []
-                for hit in hits:
-                    resource = hit.get("resource", {})
-                    documents.append({
-                        "id": resource.get("id"),
-                        "title": resource.get("name"),
-                        "url": resource.get("webUrl"),
-                        "content": resource.get("content", ""),
-                        "created": resource.get("createdDateTime"),
-                        "modified": resource.get("lastModifiedDateTime"),
-                        "author": resource.get("createdBy", {}).get("user", {}).get("displayName")
-                    })
-                
-                logger.info(f"SharePoint search returned {len(documents)} results for: {query}")
-                return documents
+            response.raise_for_status()
+            
+            result = orjson.loads(response.content)
+            hits = result.get("value", [{}])[0].get("hitsContainers", [{}])[0].get("hits", [])
+            
+            documents = []
+            for hit in hits:
+                resource = hit.get("resource", {})
+                documents.append({
+                    "id": resource.get("id"),
+                    "title": resource.get("name"),
+                    "url": resource.get("webUrl"),
+                    "content": resource.get("content", ""),
+                    "created": resource.get("createdDateTime"),
+                    "modified": resource.get("lastModifiedDateTime"),
+                    "author": resource.get("createdBy", {}).get("user", {}).get("displayName")
+                })
+            
+            logger.info("SharePoint search returned %s results for: %s", len(documents), query)
+            return documents
         
         except Exception as e:
-            logger.error(f"SharePoint search error: {str(e)}")
+            logger.error("SharePoint search error: %s", e)
             raise
     
     async def get_file_content(
         self,
         file_id: str,
-        user_token: str
-    ) -> Optional[str]:
+        user_token: str,
+        max_bytes: int = 10 * 1024 * 1024
+    ) -> Optional[Union[str, bytes]]:
         """
         Retrieve file content from SharePoint using user's token.
         
+        The download is streamed into a bounded buffer. Only text files are
+        decoded; binary formats (Office documents, PDFs, ...) are returned
+        as raw bytes to avoid a pointless decode pass.
+        
         Args:
             file_id: SharePoint file/drive item ID
             user_token: User's OAuth access token
+            max_bytes: Maximum number of bytes to download
         
         Returns:
-            File content as text or None if not accessible
+            File content as text (text/* files) or bytes, or None if not
+            accessible or larger than max_bytes
         """
         try:
             headers = {
                 "Authorization": f"Bearer {user_token}"
             }
             
-            async with httpx.AsyncClient() as client:
-                # Get file metadata
-                response = await client.get(
-                    f"{self.graph_api_base}/me/drive/items/{file_id}",
-                    headers=headers,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                
-                file_info = response.json()
-                download_url = file_info.get("@microsoft.graph.downloadUrl")
-                
-                if download_url:
-                    # Download file content
-                    content_response = await client.get(download_url, timeout=30.0)
-                    content_response.raise_for_status()
-                    return content_response.text
-                
-                return None
+            # /content redirects straight to the pre-authenticated download
+            # URL, so no separate metadata request is needed; the MIME type
+            # comes from the download's Content-Type. httpx drops the
+            # Authorization header on the cross-host redirect.
+            content = bytearray()
+            async with self._client.stream(
+                "GET",
+                f"{self.graph_api_base}/me/drive/items/{file_id}/content",
+                headers=headers,
+                follow_redirects=True,
+                timeout=30.0
+            ) as content_response:
+                content_response.raise_for_status()
+                mime_type = content_response.headers.get("content-type", "")
+                async for chunk in content_response.aiter_bytes():
+                    content += chunk
+                    if len(content) > max_bytes:
+                        logger.warning("File %s exceeds %s bytes, skipping", file_id, max_bytes)
+                        return None
+            
+            if mime_type.startswith("text/"):
+                return content.decode("utf-8", errors="replace")
+            return bytes(content)
         
         except Exception as e:
-            logger.error(f"Error retrieving file {file_id}: {str(e)}")
+            logger.error("Error retrieving file %s: %s", file_id, e)
             return None
 
 
@@ -319,7 +548,9 @@ class RAGService:
         ai_search_endpoint: Optional[str] = None,
         ai_search_key: Optional[str] = None,
         sharepoint_tenant_id: Optional[str] = None,
-        sharepoint_site_url: Optional[str] = None
+        sharepoint_site_url: Optional[str] = None,
+        cache_ttl_seconds: float = 30.0,
+        max_concurrency: int = 16
     ):
         """
         Initialize RAG service with optional Azure AI Search and SharePoint.
@@ -329,31 +560,46 @@ class RAGService:
             ai_search_key: Azure AI Search API key
             sharepoint_tenant_id: Azure AD tenant ID for SharePoint
             sharepoint_site_url: SharePoint site URL
+            cache_ttl_seconds: How long identical knowledge base searches are reused
+            max_concurrency: Maximum concurrent outbound searches per source
         """
         self.ai_search_client = None
         self.sharepoint_connector = None
+        self._kb_cache = _TTLCache(cache_ttl_seconds, max_size=256)
+        
+        # One connection pool shared by every source for keep-alive reuse
+        self._http_client = _create_http_client(max_connections=2 * max_concurrency)
         
         if ai_search_endpoint:
             self.ai_search_client = AzureAISearchClient(
                 endpoint=ai_search_endpoint,
-                api_key=ai_search_key
+                api_key=ai_search_key,
+                http_client=self._http_client,
+                max_concurrency=max_concurrency
             )
             logger.info("✓ Azure AI Search RAG enabled")
         
         if sharepoint_tenant_id and sharepoint_site_url:
             self.sharepoint_connector = SharePointMCPConnector(
                 tenant_id=sharepoint_tenant_id,
-                site_url=sharepoint_site_url
+                site_url=sharepoint_site_url,
+                http_client=self._http_client,
+                max_concurrency=max_concurrency
             )
             logger.info("✓ SharePoint RAG enabled")
     
+    async def aclose(self) -> None:
+        """Close the shared HTTP client"""
+        await self._http_client.aclose()
+    
     async def search_knowledge_base(
         self,
         query: str,
         user_email: Optional[str] = None,
         user_token: Optional[str] = None,
         sources: List[str] = ["ai_search", "sharepoint"],
-        top: int = 5
+        top: int = 5,
+        dedupe: bool = True
     ) -> Dict[str, Any]:
         """
         Search across all enabled knowledge sources.
@@ -364,46 +610,83 @@ class RAGService:
             user_token: User's OAuth token for SharePoint
             sources: List of sources to search (ai_search, sharepoint)
             top: Number of results per source
+            dedupe: Drop documents already returned by an earlier source
         
         Returns:
             Combined search results from all sources
         """
+        if not query.strip():
+            return {
+                "query": query,
+                "timestamp": datetime.utcnow().isoformat(),
+                "sources": {},
+                "error": "empty query"
+            }
+        
+        # Agent retry/planning loops often repeat the exact same search
+        cache_key = _TTLCache.make_key(query, user_email, bool(user_token), tuple(sources), top, dedupe)
+        cached = self._kb_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        
         results = {
             "query": query,
             "timestamp": datetime.utcnow().isoformat(),
             "sources": {}
         }
         
-        # Search Azure AI Search
+        # Query every enabled source concurrently so total latency is the
+        # slowest source rather than the sum of all of them
+        tasks = []
         if "ai_search" in sources and self.ai_search_client:
-            try:
-                ai_search_results = await self.ai_search_client.search(
-                    query=query,
-                    top=top,
-                    user_email=user_email
-                )
-                results["sources"]["ai_search"] = {
-                    "count": len(ai_search_results),
-                    "documents": ai_search_results
-                }
-            except Exception as e:
-                logger.error(f"AI Search failed: {e}")
-                results["sources"]["ai_search"] = {"error": str(e)}
-        
-        # Search SharePoint
+            tasks.append(("ai_search", self.ai_search_client.search(
+                query=query,
+                top=top,
+                user_email=user_email
+            )))
         if "sharepoint" in sources and self.sharepoint_connector and user_token:
-            try:
-                sharepoint_results = await self.sharepoint_connector.search_sharepoint(
-                    query=query,
-                    user_token=user_token,
-                    top=top
-                )
-                results["sources"]["sharepoint"] = {
-                    "count": len(sharepoint_results),
-                    "documents": sharepoint_results
+            tasks.append(("sharepoint", self.sharepoint_connector.search_sharepoint(
+                query=query,
+                user_token=user_token,
+                top=top
+            )))
+        
+        if tasks:
+            names, coros = zip(*tasks)
+            outcomes = await asyncio.gather(*coros, return_exceptions=True)
+            # Sources arrive ranked; keeping the first source's copy of a
+            # document keeps its best-ranked instance (AI Search wins over
+            # SharePoint). Several chunks of one document share a URL within
+            # a source, so only keys from earlier sources count as duplicates.
+            seen = set()
+            for name, outcome in zip(names, outcomes):
+                if isinstance(outcome, Exception):
+                    logger.error("%s search failed: %s", name, outcome)
+                    results["sources"][name] = {"error": str(outcome)}
+                    continue
+                
+                documents = outcome
+                if dedupe:
+                    documents = []
+                    source_keys = set()
+                    for doc in outcome:
+                        key = _document_key(doc)
+                        if key is None:
+                            documents.append(doc)
+                        elif key not in seen:
+                            source_keys.add(key)
+                            documents.append(doc)
+                    seen |= source_keys
+                    if len(documents) < len(outcome):
+                        logger.debug("Dropped %s duplicate %s documents", len(outcome) - len(documents), name)
+                
+                results["sources"][name] = {
+                    "count": len(documents),
+                    "documents": documents
                 }
-            except Exception as e:
-                logger.error(f"SharePoint search failed: {e}")
-                results["sources"]["sharepoint"] = {"error": str(e)}
+        
+        # Partial failures are not cached so the next call retries them
+        if not any("error" in source for source in results["sources"].values()):
+            self._kb_cache.set(cache_key, copy.deepcopy(results))
         
         return results
@@ -11,19 +11,35 @@ Roles:
 - guest: Limited access to public agents
 """
 
-from typing import List, Set, Optional
-from enum import Enum
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from enum import IntFlag
+from functools import lru_cache, reduce
+from itertools import compress
+from operator import or_
+from types import MappingProxyType
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
 
-class UserRole(str, Enum):
-    """Enumeration of user roles in the system"""
-    ADMIN = "admin"
-    ANALYST = "analyst"
-    USER = "user"
-    GUEST = "guest"
+class UserRole(IntFlag):
+    """
+    User roles in the system, as bit flags.
+    
+    A set of roles is a single int (e.g. ADMIN | ANALYST), so access checks
+    are one bitwise AND instead of a set intersection.
+    """
+    ADMIN = 1
+    ANALYST = 2
+    USER = 4
+    GUEST = 8
+
+
+def role_names(roles: UserRole) -> List[str]:
+    """Return the lowercase names of the roles set in a UserRole flag"""
+    return [role.name.lower() for role in UserRole if role in roles]
 
 
 class AgentAccessControl:
@@ -34,21 +50,53 @@ class AgentAccessControl:
     to users based on their assigned roles.
     """
     
+    # Used only through its static methods; no per-instance state
+    __slots__ = ()
+    
     # Default role assignments for agents
-    # Key: agent_name_pattern, Value: set of allowed roles
-    DEFAULT_AGENT_PERMISSIONS = {
-        "admin": {UserRole.ADMIN},
-        "data": {UserRole.ADMIN, UserRole.ANALYST},
-        "analytics": {UserRole.ADMIN, UserRole.ANALYST},
-        "reporting": {UserRole.ADMIN, UserRole.ANALYST},
-        "chat": {UserRole.ADMIN, UserRole.ANALYST, UserRole.USER},
-        "assistant": {UserRole.ADMIN, UserRole.ANALYST, UserRole.USER},
-        "general": {UserRole.ADMIN, UserRole.ANALYST, UserRole.USER},
-        "public": {UserRole.ADMIN, UserRole.ANALYST, UserRole.USER, UserRole.GUEST},
-    }
+    # Key: agent_name_pattern, Value: flags of allowed roles
+    # Read-only, since _KEYWORD_PATTERN and _KEYWORD_PRIORITY are built from it
+    DEFAULT_AGENT_PERMISSIONS = MappingProxyType({
+        "admin": UserRole.ADMIN,
+        "data": UserRole.ADMIN | UserRole.ANALYST,
+        "analytics": UserRole.ADMIN | UserRole.ANALYST,
+        "reporting": UserRole.ADMIN | UserRole.ANALYST,
+        "chat": UserRole.ADMIN | UserRole.ANALYST | UserRole.USER,
+        "assistant": UserRole.ADMIN | UserRole.ANALYST | UserRole.USER,
+        "general": UserRole.ADMIN | UserRole.ANALYST | UserRole.USER,
+        "public": UserRole.ADMIN | UserRole.ANALYST | UserRole.USER | UserRole.GUEST,
+    })
+    
+    # All permission keywords compiled into one regex so agent text is scanned
+    # once in C instead of once per keyword. The lookahead reports overlapping
+    # matches (e.g. "data" and "analytics" in "datanalytics").
+    _KEYWORD_PATTERN = re.compile(
+        "(?=(" + "|".join(map(re.escape, DEFAULT_AGENT_PERMISSIONS)) + "))"
+    )
+    # Declaration order decides which keyword wins when several match
+    _KEYWORD_PRIORITY = {keyword: i for i, keyword in enumerate(DEFAULT_AGENT_PERMISSIONS)}
+    
+    # Admin assignment (customize based on your requirements)
+    _ADMIN_DOMAINS = frozenset({"admin.com", "leadership.com"})
+    _ADMIN_EMAILS = frozenset()  # Add specific admin emails here
+    
+    # Map Azure AD group names to roles (add your Azure AD group mappings here)
+    _GROUP_ROLE_MAPPING = MappingProxyType({
+        "Admins": UserRole.ADMIN,
+        "DataAnalysts": UserRole.ANALYST,
+        "Analysts": UserRole.ANALYST,
+    })
+    
+    # Email substrings that grant the analyst role, scanned in a single pass
+    _ANALYST_PATTERN = re.compile("analyst|data|bi|analytics")
+    
+    # Filtering runs on every agent listing, so it is counted rather than
+    # logged per request; the totals are logged every STATS_LOG_INTERVAL calls
+    STATS_LOG_INTERVAL = 1000
+    _stats: Counter = Counter()
     
     @staticmethod
-    def get_user_roles(user_email: str, azure_user_data: dict = None) -> Set[UserRole]:
+    def get_user_roles(user_email: str, azure_user_data: dict = None) -> UserRole:
         """
         Determine user roles based on email domain, Azure AD groups, or other criteria.
         
@@ -57,126 +105,159 @@ class AgentAccessControl:
             azure_user_data: Additional Azure AD user data (groups, claims, etc.)
         
         Returns:
-            Set of UserRole values assigned to the user
+            UserRole flags assigned to the user
         """
-        roles = {UserRole.USER}  # Default role for all authenticated users
+        group_names: Tuple[str, ...] = ()
+        if azure_user_data and "groups" in azure_user_data:
+            group_names = tuple(
+                group if isinstance(group, str) else group.get("displayName", "")
+                for group in azure_user_data.get("groups", [])
+            )
+        return AgentAccessControl._resolve_user_roles(user_email, group_names)
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _resolve_user_roles(user_email: str, group_names: Tuple[str, ...]) -> UserRole:
+        """
+        Compute roles for an email and its Azure AD group names.
         
-        # Check for admin role (customize based on your requirements)
-        admin_domains = ["admin.com", "leadership.com"]
-        admin_emails = []  # Add specific admin emails here
+        Results are memoized per (email, groups), since role assignment only
+        depends on those inputs and runs on every authenticated request.
+        """
+        roles = UserRole.USER  # Default role for all authenticated users
         
-        email_domain = user_email.split("@")[-1] if "@" in user_email else ""
+        # Check for admin role
+        email_domain = user_email.rpartition("@")[2] if "@" in user_email else ""
         
-        if email_domain in admin_domains or user_email in admin_emails:
-            roles.add(UserRole.ADMIN)
-            logger.info(f"User {user_email} assigned ADMIN role")
+        if email_domain in AgentAccessControl._ADMIN_DOMAINS or user_email in AgentAccessControl._ADMIN_EMAILS:
+            roles |= UserRole.ADMIN
+            logger.info("User %s assigned ADMIN role", user_email)
         
         # Check for analyst role
-        analyst_keywords = ["analyst", "data", "bi", "analytics"]
-        if any(keyword in user_email.lower() for keyword in analyst_keywords):
-            roles.add(UserRole.ANALYST)
-            logger.info(f"User {user_email} assigned ANALYST role")
+        if AgentAccessControl._ANALYST_PATTERN.search(user_email.lower()):
+            roles |= UserRole.ANALYST
+            logger.info("User %s assigned ANALYST role", user_email)
         
         # Check Azure AD groups if available
-        if azure_user_data and "groups" in azure_user_data:
-            groups = azure_user_data.get("groups", [])
-            
-            # Map Azure AD group IDs/names to roles
-            group_role_mapping = {
-                "Admins": UserRole.ADMIN,
-                "DataAnalysts": UserRole.ANALYST,
-                "Analysts": UserRole.ANALYST,
-                # Add your Azure AD group mappings here
-            }
-            
-            for group in groups:
-                group_name = group if isinstance(group, str) else group.get("displayName", "")
-                if group_name in group_role_mapping:
-                    roles.add(group_role_mapping[group_name])
-                    logger.info(f"User {user_email} assigned {group_role_mapping[group_name]} from group {group_name}")
-        
-        logger.info(f"Final roles for {user_email}: {[r.value for r in roles]}")
+        mapping = AgentAccessControl._GROUP_ROLE_MAPPING
+        matched_groups = [name for name in group_names if name in mapping]
+        if matched_groups:
+            roles = reduce(or_, map(mapping.__getitem__, matched_groups), roles)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("User %s assigned roles from groups %s", user_email, matched_groups)
+        
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Final roles for %s: %s", user_email, role_names(roles))
         return roles
     
     @staticmethod
-    def get_agent_required_roles(agent_name: str, agent_description: str = "") -> Set[UserRole]:
+    @lru_cache(maxsize=1024)
+    def get_agent_required_roles(agent_name: str, agent_description: str = "") -> UserRole:
         """
         Determine which roles are required to access an agent based on its name/description.
         
+        Results are memoized per (name, description); agents are rebuilt from
+        the catalog on every request but their text rarely changes.
+        
         Args:
             agent_name: Name of the agent
             agent_description: Description of the agent
         
         Returns:
-            Set of UserRole values that are allowed to access this agent
+            UserRole flags that are allowed to access this agent
         """
         agent_text = f"{agent_name} {agent_description}".lower()
         
         # Check for specific keywords in agent name/description
-        for keyword, allowed_roles in AgentAccessControl.DEFAULT_AGENT_PERMISSIONS.items():
-            if keyword in agent_text:
-                logger.debug(f"Agent '{agent_name}' matched keyword '{keyword}', allowed roles: {allowed_roles}")
-                return allowed_roles
+        matched = {m.group(1) for m in AgentAccessControl._KEYWORD_PATTERN.finditer(agent_text)}
+        if matched:
+            keyword = min(matched, key=AgentAccessControl._KEYWORD_PRIORITY.__getitem__)
+            allowed_roles = AgentAccessControl.DEFAULT_AGENT_PERMISSIONS[keyword]
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Agent '%s' matched keyword '%s', allowed roles: %s", agent_name, keyword, allowed_roles)
+            return allowed_roles
         
         # Default: allow all authenticated users
-        default_roles = {UserRole.ADMIN, UserRole.ANALYST, UserRole.USER}
-        logger.debug(f"Agent '{agent_name}' using default roles: {default_roles}")
+        default_roles = UserRole.ADMIN | UserRole.ANALYST | UserRole.USER
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Agent '%s' using default roles: %s", agent_name, default_roles)
         return default_roles
     
     @staticmethod
-    def can_access_agent(user_roles: Set[UserRole], agent_required_roles: Set[UserRole]) -> bool:
+    def can_access_agent(user_roles: UserRole, agent_required_roles: UserRole) -> bool:
         """
         Check if user has permission to access an agent.
         
         Args:
-            user_roles: Set of roles assigned to the user
-            agent_required_roles: Set of roles required to access the agent
+            user_roles: Role flags assigned to the user
+            agent_required_roles: Role flags allowed to access the agent
         
         Returns:
             True if user has at least one of the required roles
         """
         has_access = bool(user_roles & agent_required_roles)
-        logger.debug(f"Access check: user_roles={user_roles}, required={agent_required_roles}, granted={has_access}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Access check: user_roles=%s, required=%s, granted=%s", user_roles, agent_required_roles, has_access)
         return has_access
     
     @staticmethod
-    def filter_agents_by_access(agents: List[dict], user_roles: Set[UserRole]) -> List[dict]:
+    def filter_agents_by_access(agents: List[dict], user_roles: UserRole) -> List[dict]:
         """
         Filter a list of agents to only include those the user can access.
         
         Args:
             agents: List of agent dictionaries
-            user_roles: Set of roles assigned to the user
+            user_roles: Role flags assigned to the user
         
         Returns:
             Filtered list of agents the user can access
         """
+        stats = AgentAccessControl._stats
+        stats["calls"] += 1
+        stats["agents_in"] += len(agents)
+        
         # Admins always see all agents
         if UserRole.ADMIN in user_roles:
-            logger.info("Admin user - returning all agents")
+            stats["admin_calls"] += 1
+            stats["agents_out"] += len(agents)
+            AgentAccessControl._maybe_log_stats()
             return agents
         
-        filtered_agents = []
-        for agent in agents:
-            agent_name = agent.get("name", "")
-            agent_description = agent.get("description", "")
-            
-            required_roles = AgentAccessControl.get_agent_required_roles(
-                agent_name, agent_description
+        # One int mask per agent (memoized per name/description), then a
+        # single AND per agent selects the accessible ones without calling
+        # back into can_access_agent
+        user_mask = int(user_roles)
+        required_masks = [
+            AgentAccessControl.get_agent_required_roles(
+                agent.get("name", ""), agent.get("description") or ""
             )
-            
-            if AgentAccessControl.can_access_agent(user_roles, required_roles):
-                filtered_agents.append(agent)
-                logger.debug(f"Agent '{agent_name}' accessible to user")
-            else:
-                logger.debug(f"Agent '{agent_name}' NOT accessible to user")
-        
-        logger.info(f"Filtered {len(agents)} agents to {len(filtered_agents)} based on user roles")
+            for agent in agents
+        ]
+        filtered_agents = list(compress(agents, [mask & user_mask for mask in required_masks]))
+        
+        stats["agents_out"] += len(filtered_agents)
+        AgentAccessControl._maybe_log_stats()
         return filtered_agents
+    
+    @staticmethod
+    def _maybe_log_stats() -> None:
+        """Emit the filter counters once every STATS_LOG_INTERVAL calls"""
+        if AgentAccessControl._stats["calls"] % AgentAccessControl.STATS_LOG_INTERVAL == 0:
+            logger.info("RBAC filter stats: %s", dict(AgentAccessControl._stats))
+    
+    @staticmethod
+    def get_stats() -> Dict[str, int]:
+        """
+        Return cumulative agent filtering counters.
+        
+        Returns:
+            Dict with call counts and total agents in/out of the filter
+        """
+        return dict(AgentAccessControl._stats)
 
 
 # Convenience functions for use in endpoints
-def get_user_roles_from_profile(user_profile: dict) -> Set[UserRole]:
+def get_user_roles_from_profile(user_profile: dict) -> UserRole:
     """Extract user roles from user profile"""
     return AgentAccessControl.get_user_roles(
         user_email=user_profile.get("email", ""),
@@ -7,19 +7,209 @@ persisting chat data including users, agents, sessions, and messages.
 Tables:
 - users: User profiles from Azure Entra ID
 - agents: AI agents from Azure Foundry
+- agent_index: Agent id -> Azure agent id, for point lookups by id
 - sessions: Chat sessions between users and agents
 - messages: Individual chat messages
 """
 
-from azure.data.tables import TableServiceClient, TableClient
-from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timezone
+from azure.data.tables import TableServiceClient, TableClient, TableTransactionError
+from azure.core.exceptions import AzureError, ResourceExistsError, ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
+from requests.adapters import HTTPAdapter
+import requests
+from typing import List, Dict, Any, Iterable, Iterator, Mapping, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from functools import cache, lru_cache
+from types import MappingProxyType
+from datetime import datetime, timedelta, timezone
+import logging
+import secrets
+import threading
 import uuid
-import json
-import ast # Added explicit import for ast module for literal_eval
+import zlib
+import orjson
+import ast # Only used for legacy Python-literal capabilities
 from config import settings
 
+logger = logging.getLogger(__name__)
+
+_TABLE_NAMES = ("users", "agents", "agent_index", "sessions", "messages")
+
+# Entity group transactions are limited to 100 operations
+_MAX_BATCH_SIZE = 100
+
+# Namespace for deterministic agent ids (uuid5 of the Azure agent id)
+_AGENT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "urn:azure-foundry:agents")
+
+# Agent properties refreshed from Azure Foundry on each sync
+_AGENT_SYNC_FIELDS = ("azure_agent_id", "name", "description", "capabilities", "is_active")
+
+# Projections for list queries: only the properties the API models use
+_AGENT_LIST_FIELDS = [
+    "PartitionKey", "RowKey", "id", "azure_agent_id", "name", "description",
+    "capabilities", "is_active", "created_at", "updated_at"
+]
+_SESSION_LIST_FIELDS = [
+    "PartitionKey", "RowKey", "id", "user_azure_id", "agent_id", "title",
+    "created_at", "updated_at", "is_active"
+]
+_MESSAGE_FIELDS = [
+    "PartitionKey", "RowKey", "id", "session_id", "role", "content",
+    "metadata", "created_at"
+]
+
+# Message RowKeys start with (_ROWKEY_MAX_US - microseconds since epoch),
+# zero-padded, so a session partition lists its newest message first.
+# Legacy keys start with an ISO timestamp ("2025-...") and always sort
+# before _LEGACY_ROWKEY_END. Descending keys for current dates start with
+# "82..." (in 2026) and stay at or above "3" until the year 2191,
+# so the two formats never interleave.
+_ROWKEY_MAX_US = 10 ** 16 - 1
+_LEGACY_ROWKEY_END = "3"
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Each session partition in the messages table also holds a copy of the
+# session entity under this RowKey, so a chat loads in one query. "_" sorts
+# after every digit, so the row lands after all messages in the partition.
+_SESSION_ROW_KEY = "__session__"
+_SESSION_MIRROR_FIELDS = ("id", "user_azure_id", "agent_id", "title", "created_at", "updated_at", "is_active")
+
+
+def _message_row_prefix(dt: datetime) -> str:
+    """Descending, fixed-width RowKey prefix for a message created at dt"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return f"{_ROWKEY_MAX_US - (dt - _EPOCH) // timedelta(microseconds=1):016d}"
+
+
+# OData filter templates; values are bound via `parameters` so the SDK
+# handles quoting and the filter text stays constant across calls
+_Q_PARTITION = "PartitionKey eq @pk"
+
+# With MESSAGE_SHARD_COUNT > 1, a session's messages are spread over
+# partitions "<session_id>:<n>" (see _message_partition). The range
+# [session_id, session_id + ";") covers the session partition itself
+# (mirror row, unsharded messages) and every shard, since ";" follows ":".
+# Which of the two filters reads use is decided per client, since it also
+# depends on whether sharding was ever enabled (see _detect_sharded_messages).
+_Q_SESSION_RANGE = "PartitionKey ge @pk and PartitionKey lt @pk_end"
+
+# Marker row recording that messages have been written sharded
+_SHARDING_MARKER_KEY = "__sharding__"
+_Q_ACTIVE_AGENTS = "PartitionKey eq 'agents' and is_active eq true"
+_Q_AGENT_BY_ID = "PartitionKey eq 'agents' and id eq @id"
+
+_json_loads = orjson.loads
+
+_datetime_now = datetime.now
+_UTC = timezone.utc
+
+# Per-request "now", set by set_request_timestamp()
+_request_now_iso: ContextVar[Optional[str]] = ContextVar("_request_now_iso", default=None)
+
+# Runs session mirror merges alongside the sessions-table merge
+_mirror_executor = ThreadPoolExecutor(
+    max_workers=settings.AZURE_STORAGE_POOL_SIZE,
+    thread_name_prefix="session-mirror"
+)
+
+# Set once the tables have been created in this process
+_tables_ensured = threading.Event()
+
+# Set once migrate_agent_capabilities has completed in this process; until
+# then _parse_caps still accepts legacy Python-literal capabilities
+_capabilities_migrated = threading.Event()
+
+
+def _now_iso() -> str:
+    """Current UTC time as an ISO 8601 string"""
+    return _datetime_now(_UTC).isoformat()
+
+
+def _message_partition(session_id: str, message_id: str) -> str:
+    """PartitionKey for a new message: the session id, or one of its shards"""
+    if settings.MESSAGE_SHARD_COUNT <= 1:
+        return session_id
+    return f"{session_id}:{zlib.crc32(message_id.encode()) % settings.MESSAGE_SHARD_COUNT}"
+
+
+def _session_rows_params(session_id: str, **params: Any) -> Dict[str, Any]:
+    """Filter parameters selecting every partition of a session's messages"""
+    return {"pk": session_id, "pk_end": session_id + ";", **params}
+
+
+def _row_key(entity: Any) -> str:
+    """Sort key merging rows read from several message partitions"""
+    return entity["RowKey"]
+
+
+def _json_dumps(obj: Any) -> str:
+    """Serialize to a JSON str (Table Storage string properties must be str)"""
+    return orjson.dumps(obj).decode()
+
+
+def _parse_legacy_caps(caps_str: str) -> Dict[str, Any]:
+    """Parse a legacy str(dict) capabilities value, or {} if it is not a dict literal"""
+    try:
+        capabilities = ast.literal_eval(caps_str.strip())
+    except (ValueError, SyntaxError):
+        return {}
+    return capabilities if isinstance(capabilities, dict) else {}
+
+
+@lru_cache(maxsize=1024)
+def _parse_caps(caps_str: str) -> Mapping[str, Any]:
+    """
+    Parse a stored agent capabilities JSON string back to a read-only mapping.
+
+    Legacy Python-literal rows are rewritten to JSON by
+    migrate_agent_capabilities() at startup. Until that has succeeded in
+    this process (e.g. storage was unreachable at boot), legacy values are
+    still parsed with ast.literal_eval so those agents keep working.
+    Results are memoized per raw string: most agents share the same
+    capabilities, so each distinct payload is parsed once and the one
+    (immutable) result is shared by every agent that has it.
+    """
+    caps_str = caps_str.strip()
+    if not caps_str:
+        return MappingProxyType({})
+    try:
+        return MappingProxyType(_json_loads(caps_str))
+    except orjson.JSONDecodeError:
+        pass
+    if not _capabilities_migrated.is_set():
+        return MappingProxyType(_parse_legacy_caps(caps_str))
+    logger.warning("Agent capabilities are not valid JSON; run migrate-capabilities")
+    return MappingProxyType({})
+
+
+def _create_transport(pool_size: int) -> RequestsTransport:
+    """
+    Build a requests transport with a connection pool sized for concurrent use.
+
+    Table calls run in worker threads, and urllib3's default of 10 pooled
+    connections per host would otherwise serialize them under load.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=True)
+
+
+def set_request_timestamp() -> None:
+    """
+    Fix "now" for the current request.
+
+    Called once per request by middleware; every created_at/updated_at
+    written during the request then shares a single formatted timestamp.
+    The value follows the request into asyncio.to_thread workers, which
+    copy the calling context.
+    """
+    _request_now_iso.set(_now_iso())
+
 
 class TableStorageClient:
     """
@@ -29,41 +219,173 @@ class TableStorageClient:
     and handles entity serialization/deserialization.
     """
 
-    def __init__(self):
-        """Initialize Table Storage client with connection string or account credentials"""
+    def __init__(self, ensure_tables: bool = False):
+        """
+        Initialize Table Storage client with connection string or account credentials.
+
+        Args:
+            ensure_tables: Create any missing tables now. Tables normally exist
+                already, so this is off by default; a table that is still missing
+                is created on the first write to it (see _write_entity).
+        """
+        transport = _create_transport(settings.AZURE_STORAGE_POOL_SIZE)
         if settings.AZURE_STORAGE_CONNECTION_STRING:
             self.service_client = TableServiceClient.from_connection_string(
-                settings.AZURE_STORAGE_CONNECTION_STRING
+                settings.AZURE_STORAGE_CONNECTION_STRING,
+                transport=transport
             )
         elif settings.AZURE_STORAGE_ACCOUNT_NAME and settings.AZURE_STORAGE_ACCOUNT_KEY:
             endpoint = f"https://{settings.AZURE_STORAGE_ACCOUNT_NAME}.table.core.windows.net"
             self.service_client = TableServiceClient(
                 endpoint=endpoint,
                 credential={"account_name": settings.AZURE_STORAGE_ACCOUNT_NAME,
-                           "account_key": settings.AZURE_STORAGE_ACCOUNT_KEY}
+                           "account_key": settings.AZURE_STORAGE_ACCOUNT_KEY},
+                transport=transport
             )
         else:
             raise ValueError("Azure Storage credentials not configured")
 
-        self._ensure_tables_exist()
+        # Warm the per-table clients up front; construction is local only
+        self._clients: Dict[str, TableClient] = {
+            table_name: self.service_client.get_table_client(table_name)
+            for table_name in _TABLE_NAMES
+        }
+
+        if ensure_tables:
+            self._ensure_tables_exist()
+
+        self._configure_message_reads(self._detect_sharded_messages())
+
+    def _detect_sharded_messages(self) -> bool:
+        """
+        Whether message reads must cover shard partitions.
+
+        The first client started with MESSAGE_SHARD_COUNT > 1 records that in
+        a marker row. Once it exists, reads and deletes keep covering the
+        shards even if the setting is lowered back to 1, so messages written
+        while sharding was on stay visible and are still deleted.
+
+        Returns:
+            True if sessions may hold sharded messages
+        """
+        if settings.MESSAGE_SHARD_COUNT > 1:
+            # Not best-effort: without the marker, lowering the setting later
+            # would hide the sharded messages this process is about to write
+            self._write_entity(
+                "messages",
+                "upsert_entity",
+                {
+                    "PartitionKey": _SHARDING_MARKER_KEY,
+                    "RowKey": _SHARDING_MARKER_KEY,
+                    "shard_count": settings.MESSAGE_SHARD_COUNT
+                },
+                mode="replace"
+            )
+            return True
+
+        try:
+            self._get_table_client("messages").get_entity(_SHARDING_MARKER_KEY, _SHARDING_MARKER_KEY)
+        except ResourceNotFoundError:
+            return False
+        except AzureError:
+            logger.warning("Could not check for sharded messages; reading all message partitions", exc_info=True)
+            return True
+        logger.warning(
+            "MESSAGE_SHARD_COUNT is 1 but messages were written sharded before; "
+            "new messages are unsharded and reads still cover the shards"
+        )
+        return True
+
+    def _configure_message_reads(self, sharded: bool) -> None:
+        """Pick the filters that select a session's message rows"""
+        rows = _Q_SESSION_RANGE if sharded else _Q_PARTITION
+        self._messages_sharded = sharded
+        self._q_session_rows = rows
+        self._q_session_messages = f"{rows} and RowKey lt @session_row"
+        self._q_recent_messages = f"{rows} and RowKey ge @legacy_end and RowKey lt @session_row"
+        self._q_legacy_messages = f"{rows} and RowKey lt @legacy_end"
+
+    @classmethod
+    def bootstrap(cls) -> "TableStorageClient":
+        """Create a client and make sure all tables exist (deployment/first run)"""
+        return cls(ensure_tables=True)
 
     def _ensure_tables_exist(self):
-        """Create tables if they don't exist"""
-        tables = ["users", "agents", "sessions", "messages"]
-        for table_name in tables:
-            try:
-                self.service_client.create_table(table_name)
-            except ResourceExistsError:
-                pass
+        """Create tables if they don't exist (once per process)"""
+        if _tables_ensured.is_set():
+            return
+        # Independent round-trips, so issue them in parallel
+        with ThreadPoolExecutor(max_workers=len(_TABLE_NAMES)) as executor:
+            list(executor.map(self._create_table_if_missing, _TABLE_NAMES))
+        _tables_ensured.set()
+
+    def _create_table_if_missing(self, table_name: str) -> None:
+        """Create a single table, ignoring it if it already exists"""
+        try:
+            self.service_client.create_table(table_name)
+        except ResourceExistsError:
+            pass
+
+    @staticmethod
+    def _is_table_missing(error: ResourceNotFoundError) -> bool:
+        """True if a 404 came from a table that does not exist (vs a missing entity)"""
+        return error.error_code == "TableNotFound"
+
+    def _query(self, table_name: str, query_filter: str, **kwargs: Any) -> Iterator[Any]:
+        """
+        Yield the entities matching a query, treating a missing table as empty.
+
+        Tables are created on first write, so on a fresh storage account a
+        read can run before its table exists; that reads as no rows.
+        """
+        try:
+            yield from self._get_table_client(table_name).query_entities(query_filter, **kwargs)
+        except ResourceNotFoundError as e:
+            if not self._is_table_missing(e):
+                raise
+
+    def _query_pages(self, table_name: str, query_filter: str, **kwargs: Any) -> Iterator[Any]:
+        """Like _query, but yield result pages so callers can stop between round trips"""
+        try:
+            yield from self._get_table_client(table_name).query_entities(query_filter, **kwargs).by_page()
+        except ResourceNotFoundError as e:
+            if not self._is_table_missing(e):
+                raise
+
+    def _write_entity(self, table_name: str, method: str, entity: Dict[str, Any], **kwargs: Any) -> None:
+        """
+        Insert an entity, creating its table on first use.
+
+        Startup issues no create_table calls; a write that finds its table
+        missing creates it and retries once.
+
+        Args:
+            table_name: Table to write to
+            method: TableClient write method ("create_entity" or "upsert_entity")
+            entity: Entity to write
+            **kwargs: Passed through to the write method
+        """
+        write = getattr(self._get_table_client(table_name), method)
+        try:
+            write(entity, **kwargs)
+        except ResourceNotFoundError as e:
+            if not self._is_table_missing(e):
+                raise
+            logger.info("Table %s not found; creating it", table_name)
+            self._create_table_if_missing(table_name)
+            write(entity, **kwargs)
 
     def _get_table_client(self, table_name: str) -> TableClient:
-        """Get table client for specific table"""
-        return self.service_client.get_table_client(table_name)
+        """Get table client for specific table (created once, then reused)"""
+        client = self._clients.get(table_name)
+        if client is None:
+            client = self._clients[table_name] = self.service_client.get_table_client(table_name)
+        return client
 
     def _to_iso_string(self, dt: Optional[datetime] = None) -> str:
-        """Convert datetime to ISO string"""
+        """Convert datetime to ISO string (defaults to the request's timestamp)"""
         if dt is None:
-            dt = datetime.now(timezone.utc)
+            return _request_now_iso.get() or _now_iso()
         return dt.isoformat()
 
     def create_user(self, azure_id: str, email: str, name: str, avatar_url: Optional[str] = None) -> Dict[str, Any]:
@@ -74,6 +396,7 @@ class TableStorageClient:
         RowKey: azure_id (for simple lookups)
         """
         table_client = self._get_table_client("users")
+        now = self._to_iso_string()
 
         entity = {
             "PartitionKey": azure_id,
@@ -83,18 +406,17 @@ class TableStorageClient:
             "email": email,
             "name": name,
             "avatar_url": avatar_url or "",
-            "created_at": self._to_iso_string(),
-            "last_login": self._to_iso_string()
+            "created_at": now,
+            "last_login": now
         }
 
         try:
             existing = table_client.get_entity(partition_key=azure_id, row_key=azure_id)
             entity["id"] = existing["id"]
             entity["created_at"] = existing["created_at"]
-            entity["last_login"] = self._to_iso_string()
             table_client.update_entity(entity, mode="replace")
         except ResourceNotFoundError:
-            table_client.create_entity(entity)
+            self._write_entity("users", "create_entity", entity)
 
         return entity
 
@@ -110,9 +432,11 @@ class TableStorageClient:
         """Update user's last login timestamp"""
         table_client = self._get_table_client("users")
         try:
-            entity = table_client.get_entity(partition_key=azure_id, row_key=azure_id)
-            entity["last_login"] = self._to_iso_string()
-            table_client.update_entity(entity, mode="replace")
+            # Merge only the changed property; no read needed
+            table_client.update_entity(
+                {"PartitionKey": azure_id, "RowKey": azure_id, "last_login": self._to_iso_string()},
+                mode="merge"
+            )
         except ResourceNotFoundError:
             pass
 
@@ -137,84 +461,145 @@ class TableStorageClient:
             "azure_agent_id": azure_agent_id,
             "name": name,
             "description": description or "",
-            "capabilities": json.dumps(capabilities or {}),
+            "capabilities": _json_dumps(capabilities or {}),
             "is_active": True,
             "updated_at": self._to_iso_string()
         }
 
         try:
             existing = table_client.get_entity(partition_key="agents", row_key=azure_agent_id)
+        except ResourceNotFoundError:
+            existing = None
+
+        if existing is None:
+            # New agents get an id derived from the Azure id, so it is stable
+            # without a lookup. Existing rows keep their original random id,
+            # since sessions reference it.
+            entity["id"] = str(uuid.uuid5(_AGENT_ID_NAMESPACE, azure_agent_id))
+            entity["created_at"] = entity["updated_at"]
+            self._write_entity("agents", "create_entity", entity)
+            self._index_agent(entity["id"], azure_agent_id)
+        else:
             entity["id"] = existing["id"]
             entity["created_at"] = existing["created_at"]
-            table_client.update_entity(entity, mode="replace")
-        except ResourceNotFoundError:
-            entity["id"] = str(uuid.uuid4())
-            entity["created_at"] = self._to_iso_string()
-            table_client.create_entity(entity)
-
-        # Parse JSON capabilities back to dict before returning
-        if "capabilities" in entity and isinstance(entity["capabilities"], str):
-            caps_str = entity["capabilities"].strip()
-            if caps_str:
-                try:
-                    # Try to parse as JSON first
-                    entity["capabilities"] = json.loads(caps_str)
-                except (json.JSONDecodeError, TypeError):
-                    try:
-                        # Fall back to evaluating as Python literal for old data
-                        entity["capabilities"] = ast.literal_eval(caps_str)
-                    except (ValueError, SyntaxError):
-                        entity["capabilities"] = {}
+            # Agents are re-synced on every listing and rarely change; skip
+            # the write when nothing did, otherwise merge the mutable fields
+            if all(existing.get(key) == entity[key] for key in _AGENT_SYNC_FIELDS):
+                entity["updated_at"] = existing.get("updated_at", entity["updated_at"])
             else:
-                entity["capabilities"] = {}
-        
+                table_client.update_entity(
+                    {key: entity[key] for key in ("PartitionKey", "RowKey", *_AGENT_SYNC_FIELDS, "updated_at")},
+                    mode="merge"
+                )
+
+        # Return capabilities as the dict that was just serialized
+        entity["capabilities"] = capabilities or {}
         return entity
 
+    @staticmethod
+    def _hydrate_agent(entity: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy an agent entity to a dict with capabilities parsed (shared, read-only)"""
+        agent = dict(entity)
+        if isinstance(agent.get("capabilities"), str):
+            agent["capabilities"] = _parse_caps(agent["capabilities"])
+        return agent
+
+    def iter_all_agents(self) -> Iterator[Dict[str, Any]]:
+        """Yield active agents page by page without materializing the catalog"""
+        entities = self._query(
+            "agents",
+            _Q_ACTIVE_AGENTS,
+            select=_AGENT_LIST_FIELDS,
+            results_per_page=200
+        )
+        for entity in entities:
+            yield self._hydrate_agent(entity)
+
     def get_all_agents(self) -> List[Dict[str, Any]]:
         """Get all active agents"""
+        return list(self.iter_all_agents())
+
+    def migrate_agent_capabilities(self) -> int:
+        """
+        Rewrite legacy Python-literal capability strings as JSON.
+
+        Rows written before capabilities were JSON-encoded hold str(dict),
+        which _parse_caps only reads via a fallback until this has run. Runs
+        at application startup and is a no-op (one projected query) once
+        every row is JSON.
+
+        Returns:
+            Number of agent rows rewritten
+        """
         table_client = self._get_table_client("agents")
-        query_filter = "PartitionKey eq 'agents' and is_active eq true"
-        entities = table_client.query_entities(query_filter)
-        agents = []
+        entities = self._query(
+            "agents",
+            _Q_PARTITION,
+            parameters={"pk": "agents"},
+            select=["PartitionKey", "RowKey", "capabilities"]
+        )
+        migrated = 0
         for entity in entities:
-            entity_dict = dict(entity)
-            # Parse JSON/Python literal capabilities back to dict
-            if "capabilities" in entity_dict and isinstance(entity_dict["capabilities"], str):
-                caps_str = entity_dict["capabilities"].strip()
-                if caps_str:
-                    try:
-                        entity_dict["capabilities"] = json.loads(caps_str)
-                    except (json.JSONDecodeError, TypeError):
-                        try:
-                            entity_dict["capabilities"] = ast.literal_eval(caps_str)
-                        except (ValueError, SyntaxError):
-                            entity_dict["capabilities"] = {}
-                else:
-                    entity_dict["capabilities"] = {}
-            agents.append(entity_dict)
-        return agents
+            caps_str = entity.get("capabilities")
+            if not isinstance(caps_str, str) or not caps_str.strip():
+                continue
+            try:
+                _json_loads(caps_str)
+                continue
+            except orjson.JSONDecodeError:
+                pass
+            capabilities = _parse_legacy_caps(caps_str)
+            table_client.update_entity(
+                {
+                    "PartitionKey": entity["PartitionKey"],
+                    "RowKey": entity["RowKey"],
+                    "capabilities": _json_dumps(capabilities)
+                },
+                mode="merge"
+            )
+            migrated += 1
+        _capabilities_migrated.set()
+        logger.info("Migrated %s agent capability rows to JSON", migrated)
+        return migrated
+
+    def _index_agent(self, agent_id: str, azure_agent_id: str) -> None:
+        """
+        Record agent id -> Azure agent id in the agent_index table.
+
+        PartitionKey/RowKey: agent id, so get_agent_by_id is a point read
+        instead of a scan over the agents partition.
+        """
+        self._write_entity("agent_index", "upsert_entity", {
+            "PartitionKey": agent_id,
+            "RowKey": agent_id,
+            "azure_agent_id": azure_agent_id
+        })
 
     def get_agent_by_id(self, agent_id: str) -> Optional[Dict[str, Any]]:
         """Get agent by ID"""
-        table_client = self._get_table_client("agents")
-        query_filter = f"PartitionKey eq 'agents' and id eq '{agent_id}'"
-        entities = list(table_client.query_entities(query_filter))
-        if entities:
-            entity = dict(entities[0])
-            # Parse JSON/Python literal capabilities back to dict
-            if "capabilities" in entity and isinstance(entity["capabilities"], str):
-                caps_str = entity["capabilities"].strip()
-                if caps_str:
-                    try:
-                        entity["capabilities"] = json.loads(caps_str)
-                    except (json.JSONDecodeError, TypeError):
-                        try:
-                            entity["capabilities"] = ast.literal_eval(caps_str)
-                        except (ValueError, SyntaxError):
-                            entity["capabilities"] = {}
-                else:
-                    entity["capabilities"] = {}
-            return entity
+        try:
+            index_entry = self._get_table_client("agent_index").get_entity(
+                partition_key=agent_id, row_key=agent_id
+            )
+            return self.get_agent_by_azure_id(index_entry["azure_agent_id"])
+        except ResourceNotFoundError:
+            pass
+
+        # Agents synced before the index existed: scan once, then index them
+        pages = self._query_pages(
+            "agents",
+            _Q_AGENT_BY_ID,
+            parameters={"id": agent_id},
+            results_per_page=1
+        )
+        # Ids are unique, so stop at the first page that yields a row. The
+        # service can return empty pages with a continuation token before
+        # the match, so keep paging until a row or the end.
+        for page in pages:
+            entity = next(iter(page), None)
+            if entity is not None:
+                self._index_agent(agent_id, entity["RowKey"])
+                return self._hydrate_agent(entity)
         return None
 
     def get_agent_by_azure_id(self, azure_agent_id: str) -> Optional[Dict[str, Any]]:
@@ -223,21 +608,7 @@ class TableStorageClient:
         # Ensure the RowKey is clean
         clean_agent_id = azure_agent_id.strip() 
         try:
-            entity = dict(table_client.get_entity(partition_key="agents", row_key=clean_agent_id))
-            # Parse JSON/Python literal capabilities back to dict
-            if "capabilities" in entity and isinstance(entity["capabilities"], str):
-                caps_str = entity["capabilities"].strip()
-                if caps_str:
-                    try:
-                        entity["capabilities"] = json.loads(caps_str)
-                    except (json.JSONDecodeError, TypeError):
-                        try:
-                            entity["capabilities"] = ast.literal_eval(caps_str)
-                        except (ValueError, SyntaxError):
-                            entity["capabilities"] = {}
-                else:
-                    entity["capabilities"] = {}
-            return entity
+            return self._hydrate_agent(table_client.get_entity(partition_key="agents", row_key=clean_agent_id))
         except ResourceNotFoundError:
             return None
 
@@ -253,9 +624,8 @@ class TableStorageClient:
         PartitionKey: user_azure_id (for efficient user-scoped queries)
         RowKey: session_id (UUID)
         """
-        table_client = self._get_table_client("sessions")
-
         session_id = str(uuid.uuid4())
+        now = self._to_iso_string()
         entity = {
             "PartitionKey": user_azure_id,
             "RowKey": session_id,
@@ -263,19 +633,38 @@ class TableStorageClient:
             "user_azure_id": user_azure_id,
             "agent_id": agent_id,
             "title": title,
-            "created_at": self._to_iso_string(),
-            "updated_at": self._to_iso_string(),
+            "created_at": now,
+            "updated_at": now,
             "is_active": True
         }
 
-        table_client.create_entity(entity)
+        self._write_entity("sessions", "create_entity", entity)
+        self._mirror_session(entity)
         return entity
 
+    def _mirror_session(self, session: Dict[str, Any]) -> None:
+        """
+        Write the session's copy into its partition of the messages table.
+
+        Best effort: the sessions table is authoritative and
+        load_session_with_messages backfills a missing mirror, so a failure
+        here is logged rather than failing the request.
+        """
+        mirror = {"PartitionKey": session["id"], "RowKey": _SESSION_ROW_KEY}
+        mirror.update((key, session[key]) for key in _SESSION_MIRROR_FIELDS)
+        try:
+            self._write_entity("messages", "upsert_entity", mirror, mode="replace")
+        except AzureError as e:
+            logger.warning("Failed to mirror session %s: %s", session["id"], e)
+
     def get_user_sessions(self, user_azure_id: str) -> List[Dict[str, Any]]:
         """Get all sessions for a user"""
-        table_client = self._get_table_client("sessions")
-        query_filter = f"PartitionKey eq '{user_azure_id}'"
-        entities = table_client.query_entities(query_filter)
+        entities = self._query(
+            "sessions",
+            _Q_PARTITION,
+            parameters={"pk": user_azure_id},
+            select=_SESSION_LIST_FIELDS
+        )
         sessions = [dict(entity) for entity in entities]
         sessions.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
         return sessions
@@ -289,32 +678,99 @@ class TableStorageClient:
             return None
 
     def update_session_timestamp(self, user_azure_id: str, session_id: str) -> None:
-        """Update session's last activity timestamp"""
-        table_client = self._get_table_client("sessions")
+        """
+        Update session's last activity timestamp.
+
+        The sessions row and its mirror in the messages table are merged in
+        parallel, so the mirror adds no round trip to the chat turn. A failed
+        mirror merge is only logged: the mirror's updated_at is informational,
+        and listings are ordered from the sessions table.
+        """
+        # Always a fresh timestamp: this runs after the turn's messages are
+        # written (for streaming, after the whole response), and
+        # get_user_sessions orders by it, so it must not predate them
+        updated_at = _now_iso()
+        mirror_update = _mirror_executor.submit(
+            self._get_table_client("messages").update_entity,
+            {"PartitionKey": session_id, "RowKey": _SESSION_ROW_KEY, "updated_at": updated_at},
+            mode="merge"
+        )
+
         try:
-            entity = table_client.get_entity(partition_key=user_azure_id, row_key=session_id)
-            entity["updated_at"] = self._to_iso_string()
-            table_client.update_entity(entity, mode="replace")
-        except ResourceNotFoundError:
-            pass
+            # Merge only the changed property; no read needed
+            self._get_table_client("sessions").update_entity(
+                {"PartitionKey": user_azure_id, "RowKey": session_id, "updated_at": updated_at},
+                mode="merge"
+            )
+        finally:
+            # Merge never creates a row, so a mirror that is missing (session
+            # deleted, or created before mirrors existed) just reads as a 404;
+            # load_session_with_messages backfills the latter on its next load
+            try:
+                mirror_update.result()
+            except ResourceNotFoundError:
+                pass
+            except AzureError as e:
+                logger.warning("Failed to update mirror of session %s: %s", session_id, e)
 
     def delete_session(self, user_azure_id: str, session_id: str) -> None:
-        """Delete session and all its messages"""
+        """
+        Delete session and all its messages (including the session's mirror row).
+
+        The mirror goes first, then the sessions row, then the messages. If a
+        later step fails, the session is either still fully readable (the
+        mirror is rebuilt from the sessions row on load) or already gone for
+        load_session_with_messages, never shown from a stale mirror.
+        """
         sessions_table = self._get_table_client("sessions")
         messages_table = self._get_table_client("messages")
 
+        try:
+            messages_table.delete_entity(partition_key=session_id, row_key=_SESSION_ROW_KEY)
+        except ResourceNotFoundError:
+            pass
+
         try:
             sessions_table.delete_entity(partition_key=user_azure_id, row_key=session_id)
         except ResourceNotFoundError:
             pass
 
-        query_filter = f"PartitionKey eq '{session_id}'"
-        messages = messages_table.query_entities(query_filter)
+        # Only the keys are needed to delete; skip message bodies
+        messages = self._query(
+            "messages",
+            self._q_session_rows,
+            parameters=_session_rows_params(session_id),
+            select=["PartitionKey", "RowKey"]
+        )
+
+        # Rows arrive grouped by partition, so they can be deleted in entity
+        # group transactions of up to 100 operations from one partition each
+        batch = []
         for message in messages:
-            messages_table.delete_entity(
-                partition_key=message["PartitionKey"],
-                row_key=message["RowKey"]
-            )
+            if batch and batch[0][1]["PartitionKey"] != message["PartitionKey"]:
+                self._submit_deletes(messages_table, batch)
+                batch = []
+            batch.append(("delete", message))
+            if len(batch) == _MAX_BATCH_SIZE:
+                self._submit_deletes(messages_table, batch)
+                batch = []
+        if batch:
+            self._submit_deletes(messages_table, batch)
+
+    def _submit_deletes(self, table_client: TableClient, operations: List[tuple]) -> None:
+        """Submit a delete transaction, falling back to single deletes on failure"""
+        try:
+            table_client.submit_transaction(operations)
+        except TableTransactionError as e:
+            logger.warning("Batch delete failed, deleting %s entities one by one: %s", len(operations), e)
+            for _, entity in operations:
+                try:
+                    table_client.delete_entity(
+                        partition_key=entity["PartitionKey"],
+                        row_key=entity["RowKey"]
+                    )
+                except ResourceNotFoundError:
+                    pass
 
     def create_message(
         self,
@@ -326,34 +782,61 @@ class TableStorageClient:
         """
         Create new chat message.
 
-        PartitionKey: session_id (for efficient session-scoped queries)
-        RowKey: timestamp + UUID (for ordering)
+        PartitionKey: session_id (for efficient session-scoped queries), or
+            one of its shards when MESSAGE_SHARD_COUNT > 1
+        RowKey: descending timestamp + random suffix (for ordering)
         """
-        table_client = self._get_table_client("messages")
-
         message_id = str(uuid.uuid4())
-        timestamp = self._to_iso_string()
+        # Always a fresh timestamp: it orders messages within the session,
+        # and one request can create both the user and assistant message
+        now = _datetime_now(_UTC)
+        timestamp = now.isoformat()
 
-        row_key = f"{timestamp}_{message_id}"
+        # The prefix already orders the row; the random suffix only has to
+        # separate messages created in the same microsecond
+        row_key = f"{_message_row_prefix(now)}_{secrets.token_hex(8)}"
 
         entity = {
-            "PartitionKey": session_id,
+            "PartitionKey": _message_partition(session_id, message_id),
             "RowKey": row_key,
             "id": message_id,
             "session_id": session_id,
             "role": role,
             "content": content,
-            "metadata": json.dumps(metadata or {}), # Ensure metadata is stored as JSON string
+            "metadata": _json_dumps(metadata or {}), # Ensure metadata is stored as JSON string
             "created_at": timestamp
         }
 
-        table_client.create_entity(entity)
+        self._write_entity("messages", "create_entity", entity)
         return entity
 
-    def get_session_messages(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _hydrate_message(entity: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a message entity to a dict with metadata parsed back to a dict"""
+        msg = dict(entity)
+        metadata = msg.get("metadata")
+        if isinstance(metadata, str):
+            try:
+                msg["metadata"] = _json_loads(metadata)
+            except orjson.JSONDecodeError:
+                msg["metadata"] = {} # Default to empty dict on parse failure
+        return msg
+
+    def get_session_messages(
+        self,
+        session_id: str,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
         """
         Get all messages for a session, ordered by creation time.
 
+        RowKeys sort newest-first (see _message_row_prefix), so with a limit
+        only the descending-keyed range is read, and reading stops once it
+        yields enough rows. The legacy ISO-keyed range is queried only when
+        the session has fewer than ``limit`` newer messages, and only its
+        tail is kept. Legacy rows always come first (oldest-first), ahead of
+        all descending-keyed rows.
+
         Args:
             session_id: Session ID
             limit: Maximum number of messages to return (most recent if limited)
@@ -361,25 +844,147 @@ class TableStorageClient:
         Returns:
             List of message entities ordered by creation time
         """
-        table_client = self._get_table_client("messages")
-        query_filter = f"PartitionKey eq '{session_id}'"
-        entities = table_client.query_entities(query_filter)
+        if not limit:
+            return list(self.iter_session_messages(session_id))
+
+        # Sharded reads cannot stop early (see below), so small pages would
+        # only multiply round trips; let the service use its full page size
+        page_size = None if self._messages_sharded else limit
+        pages = self._query_pages(
+            "messages",
+            self._q_recent_messages,
+            parameters=_session_rows_params(
+                session_id, legacy_end=_LEGACY_ROWKEY_END, session_row=_SESSION_ROW_KEY
+            ),
+            select=_MESSAGE_FIELDS,
+            results_per_page=page_size
+        )
+
+        recent: List[Any] = []  # newest first
+        for page in pages:
+            recent.extend(page)
+            # Shards each list their own newest rows first, so the newest
+            # overall are only known once every shard has been read
+            if len(recent) >= limit and not self._messages_sharded:
+                break
+
+        if self._messages_sharded:
+            recent.sort(key=_row_key)
+        recent = recent[:limit]
+        recent.reverse()
+
+        legacy: Iterable[Any] = ()
+        remaining = limit - len(recent)
+        if remaining:
+            # Legacy rows sort oldest-first, so keep only the last ones read
+            legacy = deque(
+                self._query(
+                    "messages",
+                    self._q_legacy_messages,
+                    parameters=_session_rows_params(session_id, legacy_end=_LEGACY_ROWKEY_END),
+                    select=_MESSAGE_FIELDS
+                ),
+                maxlen=remaining
+            )
 
-        messages = [dict(entity) for entity in entities]
-        messages.sort(key=lambda x: x.get("RowKey", ""))
+        return [self._hydrate_message(entity) for entity in (*legacy, *recent)]
 
-        # Parse metadata back to dict
-        for msg in messages:
-            if "metadata" in msg and isinstance(msg["metadata"], str):
-                try:
-                    msg["metadata"] = json.loads(msg["metadata"])
-                except (json.JSONDecodeError, TypeError):
-                    msg["metadata"] = {} # Default to empty dict on parse failure
-        
-        if limit:
-            messages = messages[-limit:]
+    def iter_session_messages(self, session_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yield a session's messages in creation order, hydrating each lazily.
+
+        Legacy ISO-keyed rows come first in the partition and are yielded as
+        they arrive. Descending-keyed rows arrive newest-first, so they are
+        held as raw entities until the partition is read, then yielded oldest
+        first. Only one parsed message exists at a time.
+
+        Args:
+            session_id: Session ID
+
+        Yields:
+            Message dicts with metadata parsed
+        """
+        entities = self._query(
+            "messages",
+            self._q_session_messages,
+            parameters=_session_rows_params(session_id, session_row=_SESSION_ROW_KEY),
+            select=_MESSAGE_FIELDS
+        )
+
+        recent: List[Any] = []  # newest first
+        for entity in entities:
+            if entity["RowKey"] < _LEGACY_ROWKEY_END:
+                yield self._hydrate_message(entity)
+            else:
+                recent.append(entity)
+
+        if self._messages_sharded:
+            recent.sort(key=_row_key)
+        for entity in reversed(recent):
+            yield self._hydrate_message(entity)
+
+    def load_session_with_messages(
+        self,
+        user_azure_id: str,
+        session_id: str
+    ) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Get a session and all its messages with a single partition query.
+
+        The session is read from its mirror row in the messages table. Sessions
+        without a mirror (created before it existed) are read from the sessions
+        table once and mirrored for next time.
+
+        Args:
+            user_azure_id: Azure ID of the user who must own the session
+            session_id: Session ID
+
+        Returns:
+            (session, messages), with messages ordered by creation time, or
+            (None, []) if the session does not exist or belongs to another user
+        """
+        entities = self._query("messages", self._q_session_rows, parameters=_session_rows_params(session_id))
+
+        session: Optional[Dict[str, Any]] = None
+        legacy: List[Any] = []  # oldest first
+        recent: List[Any] = []  # newest first
+        for entity in entities:
+            row_key = entity["RowKey"]
+            if row_key == _SESSION_ROW_KEY:
+                session = dict(entity)
+            elif row_key < _LEGACY_ROWKEY_END:
+                legacy.append(entity)
+            else:
+                recent.append(entity)
+
+        if session is None:
+            session = self.get_session_by_id(user_azure_id, session_id)
+            if session is None:
+                return None, []
+            self._mirror_session(session)
+        elif session.get("user_azure_id") != user_azure_id:
+            return None, []
+
+        if self._messages_sharded:
+            recent.sort(key=_row_key)
+        recent.reverse()
+        return session, [self._hydrate_message(entity) for entity in (*legacy, *recent)]
+
+@cache
+def get_table_storage() -> TableStorageClient:
+    """
+    Return the shared TableStorageClient, creating it on first use.
+
+    Deferring construction keeps imports free of network and credential
+    setup, and lets tests swap the client via get_table_storage.cache_clear().
+    """
+    return TableStorageClient(ensure_tables=settings.AZURE_STORAGE_BOOTSTRAP_TABLES)
 
-        return messages
 
+if __name__ == "__main__":
+    # One-off maintenance: python table_storage.py migrate-capabilities
+    import sys
 
-table_storage = TableStorageClient()
\ No newline at end of file
+    if sys.argv[1:] != ["migrate-capabilities"]:
+        sys.exit("usage: python table_storage.py migrate-capabilities")
+    print(f"Migrated {get_table_storage().migrate_agent_capabilities()} agent rows to JSON")
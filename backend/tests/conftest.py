@@ -0,0 +1,23 @@
+"""
+Shared pytest setup for the backend.
+
+Backend modules import each other as top-level modules (e.g. "from config
+import settings"), so the backend directory goes on sys.path. Settings are
+loaded at import time, so required values get placeholders here; tests
+never reach Azure.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for _name in (
+    "AZURE_CLIENT_ID",
+    "AZURE_TENANT_ID",
+    "AZURE_CLIENT_SECRET",
+    "AZURE_FOUNDRY_ENDPOINT",
+    "AZURE_FOUNDRY_API_KEY",
+    "AZURE_FOUNDRY_PROJECT_ID",
+):
+    os.environ.setdefault(_name, "test")
@@ -0,0 +1,304 @@
+"""
+Ordering of session messages read from Table Storage.
+
+Message RowKeys are either legacy ISO timestamps (oldest first) or
+descending timestamps (newest first), split at _LEGACY_ROWKEY_END, and may
+be spread over shard partitions. These tests run the read paths against an
+in-memory TableClient that returns rows in the service's (PartitionKey,
+RowKey) order. The session mirror row kept in the same partition is
+covered too, since it must stay consistent with the sessions table.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from azure.core.exceptions import AzureError, ResourceNotFoundError
+
+import table_storage
+from table_storage import (
+    TableStorageClient,
+    _LEGACY_ROWKEY_END,
+    _SESSION_ROW_KEY,
+    _SHARDING_MARKER_KEY,
+    _message_row_prefix,
+)
+
+SESSION_ID = "00000000-0000-0000-0000-000000000001"
+USER_ID = "user-1"
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class FakePager:
+    """Query result supporting iteration and by_page(), counting page fetches"""
+
+    def __init__(self, rows, page_size):
+        self.rows = rows
+        self.page_size = page_size
+        self.pages_fetched = 0
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+    def by_page(self):
+        for start in range(0, max(len(self.rows), 1), self.page_size):
+            self.pages_fetched += 1
+            yield iter(self.rows[start:start + self.page_size])
+
+
+class FakeTableClient:
+    """Evaluates the partition / RowKey filters used for message reads"""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda e: (e["PartitionKey"], e["RowKey"]))
+        self.pagers = []
+        self.fail_transactions = False
+
+    def query_entities(self, query_filter, parameters=None, select=None, results_per_page=None):
+        params = parameters or {}
+        rows = [row for row in self.rows if self._matches(row, query_filter, params)]
+        pager = FakePager(rows, results_per_page or 1000)
+        self.pagers.append(pager)
+        return pager
+
+    @staticmethod
+    def _matches(row, query_filter, params):
+        if "PartitionKey ge @pk" in query_filter:
+            if not params["pk"] <= row["PartitionKey"] < params["pk_end"]:
+                return False
+        elif row["PartitionKey"] != params["pk"]:
+            return False
+        if "RowKey ge @legacy_end" in query_filter and row["RowKey"] < params["legacy_end"]:
+            return False
+        if "RowKey lt @legacy_end" in query_filter and row["RowKey"] >= params["legacy_end"]:
+            return False
+        if "RowKey lt @session_row" in query_filter:
+            return row["RowKey"] < params["session_row"]
+        return True
+
+    def get_entity(self, partition_key, row_key):
+        for row in self.rows:
+            if (row["PartitionKey"], row["RowKey"]) == (partition_key, row_key):
+                return row
+        raise ResourceNotFoundError("entity not found")
+
+    def update_entity(self, entity, mode):
+        self.get_entity(entity["PartitionKey"], entity["RowKey"]).update(entity)
+
+    def delete_entity(self, partition_key, row_key):
+        self.rows.remove(self.get_entity(partition_key, row_key))
+
+    def submit_transaction(self, operations):
+        if self.fail_transactions:
+            raise AzureError("service unavailable")
+        for _, entity in operations:
+            self.delete_entity(entity["PartitionKey"], entity["RowKey"])
+
+    def pages_fetched(self):
+        return sum(pager.pages_fetched for pager in self.pagers)
+
+
+def _at(minute):
+    return START + timedelta(minutes=minute)
+
+
+def _legacy_row(minute, partition=SESSION_ID):
+    created = _at(minute).isoformat()
+    return {
+        "PartitionKey": partition,
+        "RowKey": f"{created}_legacy-{minute}",
+        "id": f"m{minute}",
+        "session_id": SESSION_ID,
+        "role": "user",
+        "content": f"message {minute}",
+        "metadata": "{}",
+        "created_at": created,
+    }
+
+
+def _row(minute, partition=SESSION_ID):
+    row = _legacy_row(minute, partition)
+    row["RowKey"] = f"{_message_row_prefix(_at(minute))}_{minute:016x}"
+    return row
+
+
+def _session_row(owner=USER_ID):
+    return {
+        "PartitionKey": SESSION_ID,
+        "RowKey": _SESSION_ROW_KEY,
+        "id": SESSION_ID,
+        "user_azure_id": owner,
+        "agent_id": "agent-1",
+        "title": "Chat",
+        "created_at": START.isoformat(),
+        "updated_at": START.isoformat(),
+        "is_active": True,
+    }
+
+
+def _sessions_row():
+    row = _session_row()
+    row.update(PartitionKey=USER_ID, RowKey=SESSION_ID)
+    return row
+
+
+def _storage(rows, sharded=False, sessions=()):
+    """A TableStorageClient whose messages and sessions tables are in-memory fakes"""
+    storage = object.__new__(TableStorageClient)
+    storage._clients = {
+        "messages": FakeTableClient([dict(row) for row in rows]),
+        "sessions": FakeTableClient([dict(row) for row in sessions]),
+    }
+    storage._configure_message_reads(sharded)
+    return storage
+
+
+def _ids(messages):
+    return [message["id"] for message in messages]
+
+
+MIXED_ROWS = [_legacy_row(1), _legacy_row(2), _row(3), _row(4), _row(5), _session_row()]
+
+
+def test_row_prefix_is_fixed_width_and_descending():
+    prefixes = [_message_row_prefix(_at(minute)) for minute in range(5)]
+    assert len({len(prefix) for prefix in prefixes}) == 1
+    assert prefixes == sorted(prefixes, reverse=True)
+    # Sub-millisecond ordering is kept too
+    assert _message_row_prefix(START + timedelta(microseconds=1)) < _message_row_prefix(START)
+
+
+def test_legacy_keys_sort_before_descending_keys_and_mirror_row_last():
+    legacy, recent, mirror = _legacy_row(1)["RowKey"], _row(1)["RowKey"], _SESSION_ROW_KEY
+    assert legacy < _LEGACY_ROWKEY_END <= recent < mirror
+
+
+def test_naive_datetimes_are_treated_as_utc():
+    assert _message_row_prefix(START.replace(tzinfo=None)) == _message_row_prefix(START)
+
+
+def test_get_session_messages_returns_creation_order():
+    messages = _storage(MIXED_ROWS).get_session_messages(SESSION_ID)
+    assert _ids(messages) == ["m1", "m2", "m3", "m4", "m5"]
+    assert messages[0]["metadata"] == {}
+
+
+def test_limit_returns_newest_messages_from_the_first_page():
+    storage = _storage([_row(3), _row(4), _row(5), _session_row()])
+    messages = storage.get_session_messages(SESSION_ID, limit=2)
+    assert _ids(messages) == ["m4", "m5"]
+    # Descending keys put the two newest rows on page one, so reading stops
+    assert storage._clients["messages"].pages_fetched() == 1
+
+
+def test_limit_skips_legacy_rows_when_enough_recent_ones_exist():
+    rows = [_legacy_row(minute) for minute in range(300)]
+    rows += [_row(minute) for minute in range(300, 330)]
+    storage = _storage([*rows, _session_row()])
+
+    messages = storage.get_session_messages(SESSION_ID, limit=20)
+
+    assert _ids(messages) == [f"m{minute}" for minute in range(310, 330)]
+    # Only the descending range is queried, and its first page is enough
+    table = storage._clients["messages"]
+    assert len(table.pagers) == 1
+    assert table.pages_fetched() == 1
+
+
+def test_limit_reads_legacy_tail_in_bounded_round_trips():
+    rows = [_legacy_row(minute) for minute in range(300)]
+    rows += [_row(minute) for minute in range(300, 305)]
+    storage = _storage([*rows, _session_row()])
+
+    messages = storage.get_session_messages(SESSION_ID, limit=20)
+
+    assert _ids(messages) == [f"m{minute}" for minute in range(285, 305)]
+    # One page of recent rows, then the legacy range at the service page size
+    assert storage._clients["messages"].pages_fetched() == 2
+
+
+def test_limit_spanning_legacy_rows_keeps_the_newest_legacy_ones():
+    messages = _storage(MIXED_ROWS).get_session_messages(SESSION_ID, limit=4)
+    assert _ids(messages) == ["m2", "m3", "m4", "m5"]
+
+
+def test_limit_larger_than_session_returns_everything():
+    messages = _storage(MIXED_ROWS).get_session_messages(SESSION_ID, limit=50)
+    assert _ids(messages) == ["m1", "m2", "m3", "m4", "m5"]
+
+
+def test_iter_session_messages_matches_list_variant():
+    storage = _storage(MIXED_ROWS)
+    assert _ids(storage.iter_session_messages(SESSION_ID)) == _ids(storage.get_session_messages(SESSION_ID))
+
+
+def test_load_session_with_messages_splits_mirror_row():
+    session, messages = _storage(MIXED_ROWS).load_session_with_messages(USER_ID, SESSION_ID)
+    assert session["id"] == SESSION_ID
+    assert _ids(messages) == ["m1", "m2", "m3", "m4", "m5"]
+
+
+def test_load_session_with_messages_rejects_other_users():
+    assert _storage(MIXED_ROWS).load_session_with_messages("someone-else", SESSION_ID) == (None, [])
+
+
+def test_update_session_timestamp_merges_session_and_mirror():
+    storage = _storage(MIXED_ROWS, sessions=[_sessions_row()])
+    storage.update_session_timestamp(USER_ID, SESSION_ID)
+
+    session = storage.get_session_by_id(USER_ID, SESSION_ID)
+    mirror, _ = storage.load_session_with_messages(USER_ID, SESSION_ID)
+    assert session["updated_at"] > START.isoformat()
+    assert mirror["updated_at"] == session["updated_at"]
+
+
+def test_delete_session_removes_mirror_and_messages():
+    storage = _storage(MIXED_ROWS, sessions=[_sessions_row()])
+    storage.delete_session(USER_ID, SESSION_ID)
+
+    assert storage._clients["messages"].rows == []
+    assert storage.load_session_with_messages(USER_ID, SESSION_ID) == (None, [])
+
+
+def test_partially_deleted_session_is_not_loaded_from_its_messages():
+    storage = _storage(MIXED_ROWS, sessions=[_sessions_row()])
+    storage._clients["messages"].fail_transactions = True
+
+    with pytest.raises(AzureError):
+        storage.delete_session(USER_ID, SESSION_ID)
+
+    # The message sweep failed, but the mirror and sessions row were
+    # deleted first, so the leftover messages no longer surface
+    assert storage._clients["messages"].rows
+    assert storage.load_session_with_messages(USER_ID, SESSION_ID) == (None, [])
+
+
+def test_sharded_rows_are_merged_by_time():
+    rows = [
+        _legacy_row(1),
+        _row(2, f"{SESSION_ID}:1"),
+        _row(3, f"{SESSION_ID}:0"),
+        _row(4, f"{SESSION_ID}:1"),
+        _row(5, f"{SESSION_ID}:0"),
+        _row(6, SESSION_ID),
+        _session_row(),
+    ]
+    storage = _storage(rows, sharded=True)
+
+    assert _ids(storage.get_session_messages(SESSION_ID)) == ["m1", "m2", "m3", "m4", "m5", "m6"]
+    assert _ids(storage.get_session_messages(SESSION_ID, limit=3)) == ["m4", "m5", "m6"]
+    session, messages = storage.load_session_with_messages(USER_ID, SESSION_ID)
+    assert session is not None
+    assert _ids(messages) == ["m1", "m2", "m3", "m4", "m5", "m6"]
+
+
+def test_sharding_marker_keeps_shard_reads_after_lowering_the_count(monkeypatch):
+    monkeypatch.setattr(table_storage.settings, "MESSAGE_SHARD_COUNT", 1)
+    marker = {"PartitionKey": _SHARDING_MARKER_KEY, "RowKey": _SHARDING_MARKER_KEY, "shard_count": 4}
+    rows = [_row(1, f"{SESSION_ID}:3"), _row(2), _session_row()]
+
+    assert not _storage(rows)._detect_sharded_messages()
+    storage = _storage([*rows, marker])
+    storage._configure_message_reads(storage._detect_sharded_messages())
+
+    assert _ids(storage.get_session_messages(SESSION_ID)) == ["m1", "m2"]
@@ -0,0 +1,61 @@
+"""
+Cross-source deduplication in RAGService.search_knowledge_base.
+
+A document returned by an earlier source is dropped from later ones, but
+results within one source (e.g. several chunks of one file) are all kept.
+"""
+
+import asyncio
+
+from rag_integration import RAGService
+
+
+class FakeSource:
+    """Stands in for both AzureAISearchClient and SharePointMCPConnector"""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def search(self, **kwargs):
+        return list(self.documents)
+
+    async def search_sharepoint(self, **kwargs):
+        return list(self.documents)
+
+
+def _doc(url, content="chunk"):
+    return {"url": url, "content": content}
+
+
+def _search(ai_search_docs, sharepoint_docs):
+    service = RAGService()
+    service.ai_search_client = FakeSource(ai_search_docs)
+    service.sharepoint_connector = FakeSource(sharepoint_docs)
+
+    async def run():
+        try:
+            return await service.search_knowledge_base("query", user_token="token")
+        finally:
+            await service.aclose()
+
+    return asyncio.run(run())["sources"]
+
+
+def test_chunks_sharing_a_url_within_one_source_are_kept():
+    chunks = [_doc("https://contoso/a.pdf", "page 1"), _doc("https://contoso/a.pdf", "page 2")]
+    sources = _search(chunks, [])
+    assert sources["ai_search"]["documents"] == chunks
+
+
+def test_document_from_an_earlier_source_is_dropped_later():
+    sources = _search(
+        [_doc("https://contoso/a.pdf")],
+        [_doc("https://contoso/a.pdf"), _doc("https://contoso/b.pdf")]
+    )
+    assert sources["sharepoint"]["documents"] == [_doc("https://contoso/b.pdf")]
+
+
+def test_empty_documents_are_never_duplicates():
+    empty = {"url": None, "content": ""}
+    sources = _search([empty], [empty, empty])
+    assert sources["sharepoint"]["count"] == 2
@@ -10,13 +10,15 @@ Usage:
 """
 
 import requests
-import json
+import orjson
 import sys
 from datetime import datetime
 
 BASE_URL = "http://localhost:8000/api"
-HEALTH_ENDPOINT = f"{BASE_URL}/health"
-MCP_CONFIG_ENDPOINT = f"{BASE_URL}/mcp-config"
+DIAGNOSTICS_ENDPOINT = f"{BASE_URL}/diagnostics"
+
+# One keep-alive connection for all checks
+SESSION = requests.Session()
 
 class Colors:
     GREEN = '\033[92m'
@@ -43,59 +45,50 @@ def print_header(text):
     print(f"{Colors.BOLD}{text}{Colors.RESET}")
     print(f"{Colors.BOLD}{Colors.BLUE}{'='*60}{Colors.RESET}\n")
 
-def check_mcp_config():
-    """Check MCP configuration status"""
-    print_header("STEP 1: MCP Configuration Check")
+def print_json(data):
+    print(orjson.dumps(data, option=orjson.OPT_INDENT_2).decode())
+
+def check_diagnostics():
+    """Check MCP configuration and health status with a single request"""
+    print_header("STEP 1: MCP Configuration and Health Check")
     
     try:
-        response = requests.get(MCP_CONFIG_ENDPOINT, timeout=5)
+        response = SESSION.get(DIAGNOSTICS_ENDPOINT, timeout=5)
         response.raise_for_status()
-        config = response.json()
+        diagnostics = orjson.loads(response.content)
         
         print_info("MCP Configuration Response:")
-        print(json.dumps(config, indent=2))
+        print_json(diagnostics.get("mcp_config", {}))
+        print_info("Health Status:")
+        print_json(diagnostics.get("health", {}))
         
-        if config.get("mcp_enabled"):
+        results = {
+            "mcp_config": bool(diagnostics.get("mcp_enabled")),
+            "health": bool(diagnostics.get("health", {}).get("mcp_enabled")),
+        }
+        
+        if results["mcp_config"]:
             print_success("MCP is ENABLED in configuration")
-            return True
         else:
             print_error("MCP is DISABLED - set MCP_ENABLED=True in .env")
-            return False
-            
-    except requests.exceptions.ConnectionError:
-        print_error(f"Cannot connect to backend at {BASE_URL}")
-        print_warning("Make sure backend is running on localhost:8000")
-        return False
-    except Exception as e:
-        print_error(f"Error checking MCP config: {str(e)}")
-        return False
-
-def check_health():
-    """Check health endpoint for MCP status"""
-    print_header("STEP 2: Health Check")
-    
-    try:
-        response = requests.get(HEALTH_ENDPOINT, timeout=5)
-        response.raise_for_status()
-        health = response.json()
-        
-        print_info("Health Status:")
-        print(json.dumps(health, indent=2))
         
-        if health.get("mcp_enabled"):
+        if results["health"]:
             print_success("MCP is ENABLED in health check")
-            return True
         else:
             print_error("MCP is DISABLED in health check")
-            return False
+        
+        return results
             
+    except requests.exceptions.ConnectionError:
+        print_error(f"Cannot connect to backend at {BASE_URL}")
+        print_warning("Make sure backend is running on localhost:8000")
     except Exception as e:
-        print_error(f"Error checking health: {str(e)}")
-        return False
+        print_error(f"Error checking diagnostics: {str(e)}")
+    return {"mcp_config": False, "health": False}
 
 def check_backend_logs():
     """Guide user to check backend logs"""
-    print_header("STEP 3: Backend Logs Verification")
+    print_header("STEP 2: Backend Logs Verification")
     
     print_info("To complete MCP verification, follow these steps:")
     print("  1. Send a chat message from the UI")
@@ -123,10 +116,7 @@ def main():
     print(f"\n{Colors.BOLD}MCP (OAuth Identity Passthrough) Verification{Colors.RESET}")
     print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
     
-    results = {
-        "mcp_config": check_mcp_config(),
-        "health": check_health(),
-    }
+    results = check_diagnostics()
     
     check_backend_logs()
     
@@ -108,7 +108,9 @@ class ApiClient {
   }
 
   async requestRagConsent(source: string): Promise<any> {
-    const response = await this.client.post("/rag/consent", null, {
+    // GET so the browser cache can reuse the response and revalidate it
+    // with If-None-Match (the backend answers 304 while the ETag matches)
+    const response = await this.client.get("/rag/consent", {
       params: { source },
     });
     return response.data;